@@ -0,0 +1,170 @@
+import argparse
+import json
+import sys
+import time
+import cv2
+import numpy as np
+from collections import deque
+from config import *
+from base_engine import FaceEngine
+from frame_source import FrameSource
+from tracker import box_iou
+
+# Smallest face (in detection pixels) the fixed configuration looks for: minSize=(30, 30)
+MIN_DETECT_SIZE = 30
+
+
+# Haar detection that searches where faces were last seen. Between periodic full-frame scans only
+# expanded ROIs around the previous frame's faces are scanned, each downscaled as far as the
+# expected face size allows and with a tight minSize/maxSize window. Full scans pick their
+# downscale factor and size limits from recently observed face sizes, but never raise the minimum
+# face size above that of the fixed RESIZE_FACTOR configuration. Boxes are full-resolution.
+class AdaptiveDetector:
+    def __init__(self, engine, full_scan_every=ADAPTIVE_FULL_SCAN_EVERY, roi_margin=ADAPTIVE_ROI_MARGIN,
+                 size_tolerance=ADAPTIVE_SIZE_TOLERANCE, history=ADAPTIVE_SIZE_HISTORY,
+                 max_downscale=ADAPTIVE_MAX_DOWNSCALE):
+        self.engine = engine
+        self.full_scan_every = full_scan_every
+        self.roi_margin = roi_margin
+        self.size_tolerance = size_tolerance
+        self.max_downscale = max_downscale
+        self.window = min((min(cascade.getOriginalWindowSize()) for _, cascade in engine.cascades), default=MIN_DETECT_SIZE)
+        self.faces = []
+        self.sizes = deque(maxlen=history)
+        self.frame_index = 0
+        self.full_scans = 0
+        self.roi_scans = 0
+
+    def detect(self, gray):
+        full = not self.faces or self.frame_index % self.full_scan_every == 0
+        self.frame_index += 1
+        faces = None if full else self.roi_scan(gray)
+        if faces is None:
+            faces = self.full_scan(gray)
+        self.faces = faces
+        self.sizes.extend(w for _, _, w, _ in faces)
+        return faces
+
+    def full_scan(self, gray):
+        self.full_scans += 1
+        fixed_min = MIN_DETECT_SIZE * RESIZE_FACTOR
+        if not self.sizes:
+            return self.scan(gray, fixed_min, None)
+        # Leave room for faces half the size of the smallest (or twice the largest) seen recently
+        return self.scan(gray, min(min(self.sizes) // 2, fixed_min), max(self.sizes) * 2)
+
+    def roi_scan(self, gray):
+        # Returns None when a tracked face was not found again, so the caller falls back to a full scan
+        self.roi_scans += 1
+        faces = []
+        for x, y, w, h in self.faces:
+            mx, my = int(w * self.roi_margin), int(h * self.roi_margin)
+            x0, y0 = max(0, x - mx), max(0, y - my)
+            x1, y1 = min(gray.shape[1], x + w + mx), min(gray.shape[0], y + h + my)
+            # The expected size is known here, so faces are shrunk right down to the cascade window
+            found = self.scan(gray[y0:y1, x0:x1], w * (1 - self.size_tolerance), w * (1 + self.size_tolerance),
+                              self.window)
+            if not found:
+                return None
+            faces.extend((fx + x0, fy + y0, fw, fh) for fx, fy, fw, fh in found)
+
+        # Overlapping ROIs can report the same face twice
+        unique = []
+        for face in faces:
+            if all(box_iou(face, kept) < 0.5 for kept in unique):
+                unique.append(face)
+        return unique
+
+    def scan(self, region, min_face, max_face, detect_size=MIN_DETECT_SIZE):
+        # Detects faces between min_face and max_face pixels wide (full resolution) in region,
+        # downscaled so that min_face becomes about detect_size pixels
+        factor = int(np.clip(min_face // detect_size, 1, self.max_downscale))
+        min_size = max(self.window, int(min_face / factor))
+        if region.shape[0] // factor < min_size or region.shape[1] // factor < min_size:
+            return []
+        small = region if factor == 1 else cv2.resize(region, (region.shape[1] // factor, region.shape[0] // factor))
+        max_size = (int(max_face / factor) + 1,) * 2 if max_face else (0, 0)
+        faces = self.engine.detect_faces(small, minSize=(min_size, min_size), maxSize=max_size)
+        return [tuple(int(v) * factor for v in face) for face in faces]
+
+    def stats(self):
+        return {'full_scans': self.full_scans, 'roi_scans': self.roi_scans}
+
+
+def compare_on_source(source, max_frames=None):
+    # Runs the fixed configuration (downscale by RESIZE_FACTOR, scan the whole frame) and the
+    # adaptive detector on the same frames and reports detection time and agreement
+    engine = FaceEngine()
+    if engine.face_cascade is None:
+        return None
+    adaptive = AdaptiveDetector(engine)
+    fixed_times, adaptive_times = [], []
+    fixed_faces = matched = adaptive_faces = 0
+
+    with FrameSource(source) as frames:
+        for frame in frames:
+            if max_frames is not None and len(fixed_times) >= max_frames:
+                break
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+            start = time.perf_counter()
+            small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR))
+            fixed = [tuple(int(v) * RESIZE_FACTOR for v in face) for face in engine.detect_faces(small_gray)]
+            fixed_times.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            found = adaptive.detect(gray)
+            adaptive_times.append(time.perf_counter() - start)
+
+            fixed_faces += len(fixed)
+            adaptive_faces += len(found)
+            matched += sum(1 for face in fixed if any(box_iou(face, other) >= 0.5 for other in found))
+
+    if not fixed_times:
+        return None
+    fixed_ms, adaptive_ms = np.asarray(fixed_times) * 1000, np.asarray(adaptive_times) * 1000
+    return {
+        'frames': len(fixed_times),
+        'fixed_mean_ms': float(fixed_ms.mean()),
+        'fixed_p95_ms': float(np.percentile(fixed_ms, 95)),
+        'adaptive_mean_ms': float(adaptive_ms.mean()),
+        'adaptive_p95_ms': float(np.percentile(adaptive_ms, 95)),
+        'savings_pct': float(100 * (1 - adaptive_ms.sum() / fixed_ms.sum())) if fixed_ms.sum() > 0 else 0.0,
+        'fixed_faces': fixed_faces,
+        'adaptive_faces': adaptive_faces,
+        # Share of the fixed configuration's detections the adaptive detector also found
+        'agreement': matched / fixed_faces if fixed_faces else None,
+        **adaptive.stats(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detection-time savings of adaptive ROI/scale Haar detection on recorded video.")
+    parser.add_argument('sources', nargs='+', help="Video files or directories of frames")
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = {}
+    for source in args.sources:
+        try:
+            result = compare_on_source(source, args.max_frames)
+        except ValueError as e:
+            logger.error(f"Skipping {source}: {e}")
+            continue
+        if result is None:
+            continue
+        report[str(source)] = result
+        logger.info(f"{source}: fixed {result['fixed_mean_ms']:.2f} ms, adaptive {result['adaptive_mean_ms']:.2f} ms "
+                    f"({result['savings_pct']:.0f}% saved, agreement {result['agreement']})")
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0 if report else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,39 +2,73 @@ import cv2
 import numpy as np
 import sys
 import os
+import time
 from pathlib import Path
 from config import *
 from base_engine import FaceEngine, logger
+from packed_dataset import PackedDataset
+from frame_source import FrameSource
+from pipeline import FramePipeline
+from instrumentation import instruments
+from face_quality import gate_for_existing, gate_for_packed
+from face_writer import FaceWriter
 
 class PersonCollector(FaceEngine):
-    def __init__(self, person_name):
+    def __init__(self, person_name, packed=USE_PACKED_DATASET):
         super().__init__()
         if not person_name:
             raise ValueError("Person name cannot be empty")
         
         self.person_name = person_name
         self.person_dir = FACE_DATA_DIR / person_name
-        self.person_dir.mkdir(parents=True, exist_ok=True)
+        # Packed mode appends captures to the packed dataset instead of writing PNGs
+        self.packed = PackedDataset() if packed else None
+        if self.packed is None:
+            self.person_dir.mkdir(parents=True, exist_ok=True)
         
         self.count_captures = 0
-        self.count_timer = 0
+        # Faces written by this collection (not the ones saved earlier), filled in by finish()
+        self.new_faces = []
+        self.last_capture = 0.0
+        # Started by collect(); encodes and writes captures off the capture loop
+        self.writer = None
+        # Rejects blurred, badly exposed and near-duplicate faces, including duplicates of saved ones
+        self.gate = None
+        if QUALITY_GATE:
+            if self.packed is not None:
+                self.gate = gate_for_packed(self.packed, person_name)
+            else:
+                self.gate = gate_for_existing(self.person_dir)
 
-    def collect(self):
-        video_capture = cv2.VideoCapture(0)
+    def collect(self, source=0, pipelined=PIPELINE_MODE):
+        self.writer = FaceWriter(self.person_name, self.person_dir, self.packed)
+        try:
+            if pipelined:
+                self.collect_pipelined(source)
+            else:
+                self.collect_serial(source)
+        finally:
+            # Runs on cancel and on errors too, so queued faces are always written
+            self.finish()
+
+    def collect_serial(self, source=0):
+        video_capture = cv2.VideoCapture(source)
         if not video_capture.isOpened():
             logger.error("Could not open video device")
             return
 
         logger.info(f"Starting capture for {self.person_name}. Need {NUM_TRAINING_IMAGES} images.")
         
+        frame = None
         while self.count_captures < NUM_TRAINING_IMAGES:
-            ret, frame = video_capture.read()
+            with instruments.span('decode'):
+                ret, frame = video_capture.read(frame)
             if not ret or frame is None:
                 logger.warning("Failed to grab frame")
                 continue
 
-            self.count_timer += 1
-            processed_frame = self.process_frame(frame)
+            with instruments.span('frame'):
+                processed_frame = self.process_frame(frame)
             
             cv2.imshow('Face Collection - Press Q to Cancel', processed_frame)
             
@@ -44,44 +78,100 @@ class PersonCollector(FaceEngine):
 
         video_capture.release()
         cv2.destroyAllWindows()
+
+    def collect_pipelined(self, source=0):
+        # Capture, preprocessing and detection run on their own threads; saving and drawing
+        # stay on this thread so the capture counter only advances on frames that are shown
+        try:
+            frames = FrameSource(source)
+        except ValueError as e:
+            logger.error(f"Could not open video device: {e}")
+            return
+
+        def detect(packet):
+            packet.results = self.select_face(packet.gray, packet.small_gray, reuse=False)
+
+        # Packets are in flight on several threads at once, so frames and crops get their own arrays
+        pipeline = FramePipeline(frames, [
+            ('preprocess', lambda packet: packet.set_preprocessed(self.preprocess(packet.frame, reuse=False))),
+            ('detect', detect),
+        ])
+
+        logger.info(f"Starting pipelined capture for {self.person_name}. Need {NUM_TRAINING_IMAGES} images.")
+        pipeline.start()
+        try:
+            for packet in pipeline.outputs():
+                self.capture_face(packet.display_frame, packet.results)
+                pipeline.draw_metrics(packet.display_frame, origin=(10, 30))
+
+                cv2.imshow('Face Collection - Press Q to Cancel', packet.display_frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    logger.info("Collection cancelled by user.")
+                    break
+                if self.count_captures >= NUM_TRAINING_IMAGES:
+                    break
+        finally:
+            if pipeline.stop():
+                frames.release()
+            else:
+                logger.warning("Capture thread is still blocked reading the source; leaving it open.")
+            cv2.destroyAllWindows()
+        logger.info(f"Pipeline metrics: {pipeline.metrics()}")
+
+    def finish(self):
+        if self.writer is not None:
+            written = self.writer.close()
+            self.new_faces = self.writer.faces
+            self.writer = None
+            if self.packed is not None:
+                logger.info(f"Appended {written} faces to {self.packed.root}")
         logger.info(f"Finished collection. Captured {self.count_captures} images.")
+        if self.gate is not None:
+            logger.info(f"Quality gate rejected {sum(self.gate.rejected.values())} faces: {self.gate.rejected}")
+        instruments.finish_run(f"collect_{self.person_name}")
 
     def process_frame(self, frame):
-        # Mirror the frame for easier positioning
-        display_frame = cv2.flip(frame, 1)
-        gray = cv2.cvtColor(display_frame, cv2.COLOR_BGR2GRAY)
-        
-        # Detect faces on a smaller image for speed
-        small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR))
+        # Mirror the frame for easier positioning and detect on a smaller image for speed
+        display_frame, gray, small_gray = self.preprocess(frame)
+        self.capture_face(display_frame, self.select_face(gray, small_gray))
+        return display_frame
+
+    def select_face(self, gray, small_gray, reuse=True):
+        # Returns ((x, y, w, h), face_resized) for the largest face, or None
         faces = self.detect_faces(small_gray)
+        if len(faces) == 0:
+            return None
+        face_sel = self.get_largest_face(faces)
         
-        if len(faces) > 0:
-            face_sel = self.get_largest_face(faces)
-            
-            # Scale back to original size
-            x, y, w, h = [v * RESIZE_FACTOR for v in face_sel]
-            
-            # Extract face ROI
-            face_roi = gray[y:y+h, x:x+w]
-            
-            if face_roi.size > 0:
-                face_resized = cv2.resize(face_roi, (FACE_WIDTH, FACE_HEIGHT))
-                
-                if self.count_timer % CAPTURE_FREQ_DIV == 0:
-                    self.count_captures += 1
-                    img_path = self.person_dir / f"{self.count_captures}.png"
-                    cv2.imwrite(str(img_path), face_resized)
-                    logger.info(f"Captured {self.count_captures}/{NUM_TRAINING_IMAGES}")
-
-                # Draw feedback
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                progress = int((self.count_captures / NUM_TRAINING_IMAGES) * 100)
-                cv2.putText(display_frame, f"{self.person_name}: {progress}%", (x, y - 10), 
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        return display_frame
+        # Scale back to original size and crop into the scratch buffer
+        return self.crop_face(gray, face_sel, out=self.face_buffer(0, reuse))
+
+    def capture_face(self, display_frame, selection):
+        if selection is None:
+            return
+        (x, y, w, h), face_resized = selection
+
+        # Captures are paced by wall time, not frames; a rejected face is retried on the next frame
+        now = time.perf_counter()
+        if now - self.last_capture >= CAPTURE_INTERVAL and (self.gate is None or self.gate.accept(face_resized)):
+            self.last_capture = now
+            self.count_captures += 1
+            self.writer.submit(face_resized)
+            logger.info(f"Captured {self.count_captures}/{NUM_TRAINING_IMAGES}")
+
+        # Draw feedback
+        with instruments.span('draw'):
+            cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            progress = int((self.count_captures / NUM_TRAINING_IMAGES) * 100)
+            cv2.putText(display_frame, f"{self.person_name}: {progress}%", (x, y - 10), 
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
 
 if __name__ == '__main__':
     name = sys.argv[1] if len(sys.argv) > 1 else "Unknown"
     collector = PersonCollector(name)
     collector.collect()
+    if ENROLL_AFTER_COLLECTION and collector.new_faces:
+        from training_logic import enroll_all
+        # Only this session's faces: earlier ones are already in the trained models
+        enroll_all(name, np.stack(collector.new_faces))
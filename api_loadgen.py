@@ -0,0 +1,139 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from urllib.parse import urlsplit
+from config import *
+from frame_source import FrameSource, IMAGE_EXTENSIONS
+
+
+def load_images(source, count=16, quality=90):
+    # JPEG-encoded request bodies: an image file as is, or `count` frames of a video, camera or image directory
+    path = Path(str(source))
+    if path.is_file() and path.suffix.lower() in IMAGE_EXTENSIONS:
+        return [path.read_bytes()]
+    images = []
+    with FrameSource(source) as frames:
+        for frame in frames:
+            images.append(cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes())
+            if len(images) == count:
+                break
+    return images
+
+
+async def open_connection(url=None, unix_path=None):
+    if unix_path:
+        return await asyncio.open_unix_connection(unix_path)
+    parts = urlsplit(url)
+    return await asyncio.open_connection(parts.hostname, parts.port or 80)
+
+
+async def request(reader, writer, method, path, body=b''):
+    # One keep-alive HTTP/1.1 request; returns (status, JSON payload)
+    writer.write(f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/octet-stream\r\n"
+                 f"Content-Length: {len(body)}\r\n\r\n".encode('latin-1') + body)
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1').split('\r\n')
+    status = int(head[0].split(' ', 2)[1])
+    length = next(int(line.split(':', 1)[1]) for line in head[1:] if line.lower().startswith('content-length:'))
+    return status, json.loads(await reader.readexactly(length))
+
+
+async def health(url=None, unix_path=None):
+    reader, writer = await open_connection(url, unix_path)
+    try:
+        return (await request(reader, writer, 'GET', '/health'))[1]
+    finally:
+        writer.close()
+
+
+async def client(url, unix_path, path, images, offset, deadline, latencies, errors):
+    # One simulated caller: sends requests back to back on its own connection until the deadline
+    reader, writer = await open_connection(url, unix_path)
+    i = offset
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, 'POST', path, images[i % len(images)])
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors.append(status)
+            i += 1
+    finally:
+        writer.close()
+
+
+async def run_level(url, unix_path, path, images, concurrency, duration):
+    before = await health(url, unix_path)
+    latencies, errors = [], []
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(client(url, unix_path, path, images, i, deadline, latencies, errors)
+                           for i in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    after = await health(url, unix_path)
+
+    batches = after['batches'] - before['batches']
+    result = {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'throughput_rps': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'mean_batch_size': (after['requests'] - before['requests']) / batches if batches else 0.0,
+    }
+    if latencies:
+        ms = np.asarray(latencies) * 1000
+        result.update({'mean_ms': float(ms.mean()), 'p50_ms': float(np.percentile(ms, 50)),
+                       'p95_ms': float(np.percentile(ms, 95)), 'p99_ms': float(np.percentile(ms, 99)),
+                       'max_ms': float(ms.max())})
+    return result
+
+
+async def run(url, unix_path, endpoint, images, concurrencies, duration):
+    report = {'endpoint': endpoint, 'server': await health(url, unix_path), 'levels': []}
+    for concurrency in concurrencies:
+        result = await run_level(url, unix_path, f'/{endpoint}', images, concurrency, duration)
+        report['levels'].append(result)
+        logger.info(f"{concurrency:>4} clients: {result['throughput_rps']:.1f} req/s, "
+                    f"p50 {result.get('p50_ms', 0):.1f} ms, p99 {result.get('p99_ms', 0):.1f} ms, "
+                    f"batch {result['mean_batch_size']:.1f}, {result['errors']} errors")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for recognition_api.py: throughput and tail latency per concurrency level.")
+    parser.add_argument('source', help="Image file, video file, directory of images or camera index to send")
+    parser.add_argument('--url', default=f"http://{API_HOST}:{API_PORT}")
+    parser.add_argument('--unix', dest='unix_path', help="Connect to this Unix socket instead of --url")
+    parser.add_argument('--endpoint', choices=['recognize', 'detect'], default='recognize')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--duration', type=float, default=10, help="Seconds per concurrency level")
+    parser.add_argument('--images', type=int, default=16, help="Distinct frames to cycle through")
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    images = load_images(args.source, args.images)
+    if not images:
+        logger.error(f"No images could be read from {args.source}")
+        return 1
+    try:
+        report = asyncio.run(run(args.url, args.unix_path, args.endpoint, images, args.concurrency, args.duration))
+    except (ConnectionError, FileNotFoundError) as e:
+        logger.error(f"Could not reach the recognition API: {e}")
+        return 1
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.json_path}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
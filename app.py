@@ -89,6 +89,7 @@ class FaceApp:
         ttk.Button(btn_grid, text="Train LBPH", command=lambda: self.run_training("lbph")).grid(row=0, column=0, padx=5, pady=5, sticky="nsew")
         ttk.Button(btn_grid, text="Train Eigen", command=lambda: self.run_training("eigen")).grid(row=0, column=1, padx=5, pady=5, sticky="nsew")
         ttk.Button(btn_grid, text="Train Fisher", command=lambda: self.run_training("fisher")).grid(row=1, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
+        ttk.Button(btn_grid, text="Train All (Parallel)", command=lambda: self.run_training("all"), style="Action.TButton").grid(row=2, column=0, columnspan=2, padx=5, pady=5, sticky="nsew")
         
         btn_grid.columnconfigure(0, weight=1)
         btn_grid.columnconfigure(1, weight=1)
@@ -115,6 +116,8 @@ class FaceApp:
             btn = ttk.Button(eval_btn_frame, text=f"BENCHMARK {algo.upper()}", command=cmd)
             btn.pack(fill="x", pady=5)
 
+        ttk.Button(eval_btn_frame, text="BENCHMARK DLIB (DL BASELINE)", command=self.run_dlib).pack(fill="x", pady=5)
+
         ttk.Separator(eval_btn_frame, orient="horizontal").pack(fill="x", pady=15)
         
         # Abstract Viewer
@@ -1,26 +1,131 @@
 import cv2
-from config import CASCADE_PATH, logger
+import time
+import numpy as np
+from collections import deque
+from pathlib import Path
+from config import (BENCHMARK_WINDOW, CASCADES, ENSEMBLE_NMS_IOU, FACE_HEIGHT, FACE_WIDTH, HAARCASCADE_DIR,
+                    MIRROR_PROFILE, RESIZE_FACTOR, REUSE_FRAME_BUFFERS, logger)
+from frame_buffers import FrameBuffers
+from instrumentation import instruments
+
+
+def resolve_cascade(cascade):
+    # Accepts a cascade path or the name of a bundled cascade such as 'frontalface_alt2'
+    path = Path(cascade)
+    if path.suffix == '.xml':
+        return path
+    return HAARCASCADE_DIR / f"haarcascade_{cascade}.xml"
+
+
+def is_profile_cascade(name):
+    return 'profile' in name
+
+
+def non_max_suppression(boxes, scores, iou_threshold=ENSEMBLE_NMS_IOU):
+    # Greedy NMS: keeps the highest-scoring box of every group overlapping by more than iou_threshold
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return boxes
+    x0, y0 = boxes[:, 0], boxes[:, 1]
+    x1, y1 = x0 + boxes[:, 2], y0 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    keep = []
+    while len(order):
+        best, rest = order[0], order[1:]
+        keep.append(best)
+        inter = (np.clip(np.minimum(x1[best], x1[rest]) - np.maximum(x0[best], x0[rest]), 0, None)
+                 * np.clip(np.minimum(y1[best], y1[rest]) - np.maximum(y0[best], y0[rest]), 0, None))
+        iou = inter / (areas[best] + areas[rest] - inter)
+        order = rest[iou <= iou_threshold]
+    return boxes[keep]
+
 
 class FaceEngine:
-    def __init__(self):
-        if not CASCADE_PATH.exists():
-            logger.error(f"Cascade file not found at {CASCADE_PATH}")
-            self.face_cascade = None
-        else:
-            self.face_cascade = cv2.CascadeClassifier(str(CASCADE_PATH))
-            if self.face_cascade.empty():
-                logger.error("Failed to load cascade classifier.")
-
-    def detect_faces(self, gray_img, scaleFactor=1.1, minNeighbors=5):
+    def __init__(self, cascades=None):
+        # One or more Haar cascades; with several, detections are merged with NMS
+        self.cascades = []
+        for cascade in cascades or CASCADES:
+            path = resolve_cascade(cascade)
+            if not path.exists():
+                logger.error(f"Cascade file not found at {path}")
+                continue
+            classifier = cv2.CascadeClassifier(str(path))
+            if classifier.empty():
+                logger.error(f"Failed to load cascade classifier {path}.")
+                continue
+            self.cascades.append((path.stem, classifier))
+        self.face_cascade = self.cascades[0][1] if self.cascades else None
+
+        # Rolling display rate for the on-screen overlays
+        self.fps_deque = deque(maxlen=BENCHMARK_WINDOW)
+        self.last_time = time.time()
+        self.buffers = FrameBuffers() if REUSE_FRAME_BUFFERS else None
+
+    def update_fps(self):
+        # Call once per displayed frame; returns the average FPS over the window
+        curr_time = time.time()
+        dt = curr_time - self.last_time
+        if dt > 0:
+            self.fps_deque.append(1.0 / dt)
+        self.last_time = curr_time
+        return sum(self.fps_deque) / len(self.fps_deque) if self.fps_deque else 0
+
+    def preprocess(self, frame, display=True, reuse=True):
+        # Mirror for display, convert to gray and downscale for fast detection. Without display,
+        # display_frame is None and only the single-channel gray is mirrored. With reuse, the
+        # results live in self.buffers and are overwritten by the next call; threaded callers
+        # that keep frames in flight pass reuse=False.
+        buffers = self.buffers.frame(frame.shape) if self.buffers is not None and reuse else None
+        with instruments.span('convert'):
+            if display:
+                display_frame = cv2.flip(frame, 1, dst=buffers.display if buffers else None)
+                gray = cv2.cvtColor(display_frame, cv2.COLOR_BGR2GRAY, dst=buffers.gray if buffers else None)
+            else:
+                display_frame = None
+                capture_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=buffers.capture_gray if buffers else None)
+                gray = cv2.flip(capture_gray, 1, dst=buffers.gray if buffers else None)
+        with instruments.span('resize'):
+            small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR),
+                                    dst=buffers.small_gray if buffers else None)
+        return display_frame, gray, small_gray
+
+    def face_buffer(self, i, reuse=True):
+        # Scratch destination for the i-th face crop of a frame, or None to allocate
+        return self.buffers.face(i) if self.buffers is not None and reuse else None
+
+    def crop_face(self, gray, face, scale=RESIZE_FACTOR, out=None):
+        # Scales a detection on the downscaled frame back up and returns (box, face_resized)
+        x, y, w, h = [int(v) * scale for v in face]
+        face_roi = gray[y:y+h, x:x+w]
+        if face_roi.size == 0:
+            return None
+        return (x, y, w, h), cv2.resize(face_roi, (FACE_WIDTH, FACE_HEIGHT), dst=out)
+
+    def detect_faces(self, gray_img, scaleFactor=1.1, minNeighbors=5, minSize=(30, 30), maxSize=(0, 0)):
+        with instruments.span('detect'):
+            return self.run_cascades(gray_img, scaleFactor, minNeighbors, minSize, maxSize)
+
+    def run_cascades(self, gray_img, scaleFactor, minNeighbors, minSize, maxSize):
+        # maxSize=(0, 0) means no upper limit
         if self.face_cascade is None:
             return []
-        return self.face_cascade.detectMultiScale(
-            gray_img,
-            scaleFactor=scaleFactor,
-            minNeighbors=minNeighbors,
-            minSize=(30, 30),
-            flags=cv2.CASCADE_SCALE_IMAGE
-        )
+        params = dict(scaleFactor=scaleFactor, minNeighbors=minNeighbors, minSize=minSize, maxSize=maxSize,
+                      flags=cv2.CASCADE_SCALE_IMAGE)
+        if len(self.cascades) == 1 and not is_profile_cascade(self.cascades[0][0]):
+            return self.face_cascade.detectMultiScale(gray_img, **params)
+
+        boxes, scores = [], []
+        for name, cascade in self.cascades:
+            found, neighbors = cascade.detectMultiScale2(gray_img, **params)
+            boxes.extend(found)
+            scores.extend(neighbors)
+            if is_profile_cascade(name) and MIRROR_PROFILE:
+                found, neighbors = cascade.detectMultiScale2(cv2.flip(gray_img, 1), **params)
+                boxes.extend((gray_img.shape[1] - x - w, y, w, h) for x, y, w, h in found)
+                scores.extend(neighbors)
+        # The number of merged neighbour windows serves as the detection score
+        return non_max_suppression(boxes, scores)
 
     def get_largest_face(self, faces):
         if len(faces) == 0:
@@ -0,0 +1,232 @@
+import argparse
+import csv
+import json
+import sys
+import time
+import numpy as np
+from pathlib import Path
+from config import logger
+from base_engine import FaceEngine
+from frame_source import FrameSource
+from recog_logic import FaceRecognizer
+from instrumentation import instruments
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ALGORITHMS = ['haar', 'lbph', 'lbph_numpy', 'eigen', 'fisher', 'dlib']
+PERCENTILES = (50, 95, 99)
+CSV_FIELDS = ['algorithm', 'stage', 'samples', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms', 'throughput_fps', 'peak_rss_mb']
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux (bytes on macOS)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class StageTimer:
+    def __init__(self):
+        self.samples = {}
+
+    def wrap(self, stage, func):
+        samples = self.samples.setdefault(stage, [])
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            samples.append(time.perf_counter() - start)
+            return result
+        return timed
+
+    def record(self, stage, duration):
+        self.samples.setdefault(stage, []).append(duration)
+
+    def reset(self):
+        for samples in self.samples.values():
+            samples.clear()
+
+    def summary(self):
+        stats = {}
+        for stage, samples in self.samples.items():
+            if not samples:
+                continue
+            ms = np.asarray(samples) * 1000
+            stats[stage] = {'samples': len(samples), 'mean_ms': float(ms.mean())}
+            for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+                stats[stage][f'p{p}_ms'] = float(value)
+        return stats
+
+
+def build_pipeline(algo, timer, tracking=False, adaptive=False, headless=False, reload=False):
+    # Wraps the engine's own stage methods so the measured code is exactly what runs live
+    if algo == 'haar':
+        engine = FaceEngine()
+        if engine.face_cascade is None:
+            return engine, None
+    elif reload:
+        # Reload measurements need a privately loaded model; a shared one is swapped by the host
+        engine = FaceRecognizer(algo, tracking=tracking, adaptive=adaptive, host=False, hot_reload=True)
+        if not engine.is_loaded:
+            return engine, None
+    else:
+        engine = FaceRecognizer(algo, tracking=tracking, adaptive=adaptive)
+        if not engine.is_loaded:
+            return engine, None
+
+    engine.preprocess = timer.wrap('preprocess', engine.preprocess)
+    if algo == 'dlib':
+        # Only frames picked by the stride record detect/predict samples
+        engine.dlib_detect = timer.wrap('detect', engine.dlib_detect)
+        engine.dlib_predict = timer.wrap('predict', engine.dlib_predict)
+    elif getattr(engine, 'adaptive', None) is not None:
+        # One sample per frame rather than one per ROI scan
+        engine.adaptive.detect = timer.wrap('detect', engine.adaptive.detect)
+    else:
+        engine.detect_faces = timer.wrap('detect', engine.detect_faces)
+
+    # Headless runs skip the colour flip and the drawing, as a service without a window would
+    if algo == 'haar':
+        def process(frame):
+            return engine.detect_faces(engine.preprocess(frame, display=not headless)[2])
+    else:
+        if algo != 'dlib':
+            engine.predict_faces = timer.wrap('predict', engine.predict_faces)
+
+        def process(frame):
+            return engine.process_frame(frame, display=not headless)
+
+    return engine, timer.wrap('frame', process)
+
+
+def run_benchmark(algo, source, max_frames=None, warmup=5, loop=False, tracking=False, adaptive=False, trace_path=None,
+                  headless=False, reload_every=None):
+    timer = StageTimer()
+    reloader = None
+    if reload_every and algo not in ('haar', 'dlib'):
+        engine, process = build_pipeline(algo, timer, tracking, adaptive, headless, reload=True)
+        reloader = getattr(engine, 'reloader', None)
+    else:
+        engine, process = build_pipeline(algo, timer, tracking, adaptive, headless)
+    if process is None:
+        logger.error(f"Skipping {algo}: detector or model could not be loaded.")
+        return None
+
+    logger.info(f"Benchmarking {algo.upper()} on {source}")
+    frames = 0
+    with FrameSource(source, loop=loop) as frame_source:
+        frame_iter = iter(frame_source)
+        start = time.perf_counter()
+        while max_frames is None or frames < max_frames + warmup:
+            decode_start = time.perf_counter()
+            frame = next(frame_iter, None)
+            if frame is None:
+                break
+            timer.record('decode', time.perf_counter() - decode_start)
+            if reloader is not None and frames > warmup and (frames - warmup) % reload_every == 0:
+                # Reloads the trained model from disk as a retrain would, while frames keep coming
+                reloader.reload()
+            reloading = reloader is not None and (reloader.loading() or reloader.ready is not None)
+            process(frame)
+            if reloading:
+                timer.record('frame_during_reload', timer.samples['frame'][-1])
+            frames += 1
+            if frames == warmup:
+                timer.reset()
+                instruments.reset()
+                start = time.perf_counter()
+        elapsed = time.perf_counter() - start
+
+    measured = frames - warmup
+    if measured <= 0:
+        logger.error(f"Source {source} has no frames beyond the {warmup} warmup frames.")
+        return None
+
+    result = {
+        'frames': measured,
+        'elapsed_s': elapsed,
+        'throughput_fps': measured / elapsed if elapsed > 0 else 0.0,
+        # Process-wide high-water mark: run one algorithm per invocation for isolated numbers
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': timer.summary(),
+    }
+    if reloader is not None:
+        # swap_ms is the time the frame loop is paused for a swap; loading happens on a background thread
+        result['reload'] = reloader.stats()
+    if getattr(engine, 'stride', None) is not None:
+        result['stride'] = engine.stride.stats()
+    if instruments.enabled:
+        # Finer-grained spans (convert, resize, per-scan detect, draw, ...) from the shared instrumentation
+        result['spans'] = instruments.summary()
+        if trace_path:
+            instruments.write_trace(trace_path)
+    return result
+
+
+def write_csv(results, path):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for algo, result in results.items():
+            for stage, stats in result['stages'].items():
+                writer.writerow({
+                    'algorithm': algo,
+                    'stage': stage,
+                    **stats,
+                    'throughput_fps': result['throughput_fps'],
+                    'peak_rss_mb': result['peak_rss_mb'],
+                })
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless detection/recognition benchmark on recorded frames.")
+    parser.add_argument('source', help="Video file, directory of images or camera index")
+    parser.add_argument('--algos', nargs='+', choices=ALGORITHMS, default=ALGORITHMS)
+    parser.add_argument('--max-frames', type=int, default=None)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--loop', action='store_true', help="Loop the source until --max-frames is reached")
+    parser.add_argument('--track', action='store_true', help="Detect every TRACK_DETECT_EVERY frames and track in between")
+    parser.add_argument('--adaptive', action='store_true', help="Use adaptive ROI/scale detection for the recognizers")
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    parser.add_argument('--csv', dest='csv_path', help="Write per-stage rows as CSV")
+    parser.add_argument('--headless', action='store_true', help="Measure without the display flip and drawing")
+    parser.add_argument('--reload-every', type=int, metavar='N',
+                        help="Hot-reload the recognizer's model every N frames and report swap stall times")
+    parser.add_argument('--trace', dest='trace_path', type=Path,
+                        help="Record instrumentation spans and write a Chrome trace per algorithm (<name>_<algo>.json)")
+    args = parser.parse_args(argv)
+
+    if args.loop and args.max_frames is None:
+        parser.error("--loop requires --max-frames")
+
+    if args.trace_path:
+        instruments.enable()
+    results = {}
+    for algo in args.algos:
+        trace_path = args.trace_path.with_name(f"{args.trace_path.stem}_{algo}.json") if args.trace_path else None
+        result = run_benchmark(algo, args.source, args.max_frames, args.warmup, args.loop, args.track, args.adaptive,
+                               trace_path, args.headless, args.reload_every)
+        if result is not None:
+            results[algo] = result
+
+    report = {'source': str(args.source), 'warmup': args.warmup, 'tracking': args.track, 'adaptive': args.adaptive,
+              'headless': args.headless, 'reload_every': args.reload_every, 'results': results}
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.json_path}")
+    else:
+        print(json.dumps(report, indent=2))
+    if args.csv_path:
+        write_csv(results, args.csv_path)
+        logger.info(f"CSV written to {args.csv_path}")
+
+    return 0 if results else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
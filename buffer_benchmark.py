@@ -0,0 +1,122 @@
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+import cv2
+import numpy as np
+from config import *
+from base_engine import FaceEngine
+from frame_buffers import FrameBuffers
+from frame_source import FrameSource
+
+RESOLUTIONS = {'720p': (1280, 720), '1080p': (1920, 1080)}
+# 'allocating' is the per-frame behaviour before preallocated buffers
+MODES = {
+    'allocating': {'reuse': False, 'display': True},
+    'reused': {'reuse': True, 'display': True},
+    'reused_headless': {'reuse': True, 'display': False},
+}
+
+
+def load_frames(source, size, count):
+    # Decodes `count` frames up front (looping short sources) and scales them to `size`, so
+    # decoding and scaling are not part of the measurement
+    frames = []
+    with FrameSource(source, loop=True) as frame_source:
+        for frame in frame_source:
+            frames.append(cv2.resize(frame, size))
+            if len(frames) == count:
+                break
+    return frames
+
+
+def process(engine, frame, faces, reuse, display):
+    # The per-frame array work of the recognition and collection loops: preprocessing plus one
+    # FACE_WIDTH x FACE_HEIGHT crop per face. Detection is left out since buffers do not change it.
+    display_frame, gray, small_gray = engine.preprocess(frame, display=display, reuse=reuse)
+    crops = [engine.crop_face(gray, face, out=engine.face_buffer(i, reuse)) for i, face in enumerate(faces)]
+    return [a for a in (display_frame, gray, small_gray) if a is not None] + [c[1] for c in crops if c is not None]
+
+
+def fresh_arrays(engine, outputs):
+    # Outputs that do not live in one of the preallocated buffers
+    buffers = engine.buffers
+    pooled = [buffers.display, buffers.gray, buffers.capture_gray, buffers.small_gray, buffers.faces] if buffers.shape else []
+    return sum(1 for out in outputs if not any(np.shares_memory(out, b) for b in pooled))
+
+
+def measure(engine, frames, faces, reuse, display, repeats=3):
+    # Allocation pass under tracemalloc (which OpenCV's NumPy arrays report to), then untraced timing passes
+    fresh, allocated = [], []
+    tracemalloc.start()
+    for frame, frame_faces in zip(frames, faces):
+        baseline = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        outputs = process(engine, frame, frame_faces, reuse, display)
+        allocated.append(tracemalloc.get_traced_memory()[1] - baseline)
+        fresh.append(fresh_arrays(engine, outputs))
+        del outputs
+    tracemalloc.stop()
+
+    times = []
+    for _ in range(repeats):
+        for frame, frame_faces in zip(frames, faces):
+            start = time.perf_counter()
+            process(engine, frame, frame_faces, reuse, display)
+            times.append(time.perf_counter() - start)
+    ms = np.asarray(times) * 1000
+    return {
+        'fresh_arrays_per_frame': float(np.mean(fresh)),
+        'allocated_kb_per_frame': float(np.mean(allocated) / 1024),
+        'mean_ms': float(ms.mean()),
+        'p95_ms': float(np.percentile(ms, 95)),
+    }
+
+
+def run(source, resolutions=tuple(RESOLUTIONS), count=100, repeats=3):
+    report = {}
+    for resolution in resolutions:
+        frames = load_frames(source, RESOLUTIONS[resolution], count)
+        if not frames:
+            logger.error(f"No frames could be read from {source}")
+            return None
+        engine = FaceEngine()
+        faces = [engine.detect_faces(engine.preprocess(frame, reuse=False)[2]) for frame in frames]
+        report[resolution] = {'frames': len(frames), 'faces': int(sum(len(f) for f in faces)), 'modes': {}}
+        for mode, options in MODES.items():
+            # A fresh engine per mode, so buffer allocation shows up as a one-off in the first frame
+            engine = FaceEngine()
+            engine.buffers = engine.buffers or FrameBuffers()
+            stats = measure(engine, frames, faces, options['reuse'], options['display'], repeats)
+            stats['buffer_allocations'] = engine.buffers.allocations
+            report[resolution]['modes'][mode] = stats
+            logger.info(f"{resolution} {mode}: {stats['mean_ms']:.3f} ms (p95 {stats['p95_ms']:.3f}), "
+                        f"{stats['fresh_arrays_per_frame']:.2f} fresh arrays and "
+                        f"{stats['allocated_kb_per_frame']:.0f} KB allocated per frame")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-frame allocations and latency with and without preallocated frame buffers.")
+    parser.add_argument('source', help="Video file, directory of images or camera index")
+    parser.add_argument('--resolutions', nargs='+', choices=list(RESOLUTIONS), default=list(RESOLUTIONS))
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--repeats', type=int, default=3, help="Timing passes over the frames")
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(args.source, args.resolutions, args.frames, args.repeats)
+    if report is None:
+        return 1
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.json_path}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from config import *
+from evaluate import MODEL_THRESHOLDS, MODEL_TYPES, gallery_and_queries, split_folds
+from gallery_index import pairwise_distances
+from training_logic import FaceTrainer, load_training_data, save_thresholds
+
+# Identities need at least this many impostor attempts before they get their own threshold
+MIN_IDENTITY_IMPOSTORS = 20
+
+
+def identity_distances(model_type, images, labels, k=5, seed=0):
+    # Held-out distances from every face to the nearest gallery sample of every identity,
+    # collected over k folds: returns an (N, num_labels) matrix and the labels of the rows
+    folds = split_folds(labels, k, seed)
+    num_labels = int(labels.max()) + 1
+    rows, row_labels = [], []
+    for fold in range(k):
+        train, test = folds != fold, folds == fold
+        if not test.any():
+            continue
+        model = FaceTrainer(model_type).model
+        model.train(list(np.asarray(images[train])), labels[train])
+        vectors, queries, metric = gallery_and_queries(model_type, model, np.asarray(images[test]))
+        distances = pairwise_distances(queries, vectors, metric)
+        gallery_labels = np.asarray(model.getLabels()).reshape(-1)
+
+        per_identity = np.full((len(queries), num_labels), np.inf)
+        for label_id in np.unique(gallery_labels):
+            per_identity[:, label_id] = distances[:, gallery_labels == label_id].min(axis=1)
+        rows.append(per_identity)
+        row_labels.append(labels[test])
+    return np.vstack(rows), np.concatenate(row_labels)
+
+
+def threshold_for_far(impostor, target_far):
+    # Largest threshold t (faces accepted when distance < t) whose impostor accept rate is <= target_far
+    impostor = np.sort(impostor[np.isfinite(impostor)])
+    if len(impostor) == 0:
+        return None
+    return float(impostor[min(int(np.floor(target_far * len(impostor))), len(impostor) - 1)])
+
+
+def calibrate(model_type, dataset=None, target_far=CALIBRATION_TARGET_FAR, per_identity=False, k=5, seed=0):
+    images, labels, label_map = dataset if dataset is not None else load_training_data()
+    if images is None:
+        return None
+    labels = np.asarray(labels)
+    if len(np.unique(labels)) < 2:
+        logger.error("Calibration needs at least 2 people to measure impostor distances.")
+        return None
+
+    start = time.perf_counter()
+    distances, row_labels = identity_distances(model_type, images, labels, k, seed)
+    rows = np.arange(len(row_labels))
+    genuine = distances[rows, row_labels]
+    # As a would-be match for someone else, every face counts against the nearest other identity
+    others = distances.copy()
+    others[rows, row_labels] = np.inf
+    impostor = others.min(axis=1)
+
+    threshold = threshold_for_far(impostor, target_far)
+    if threshold is None:
+        logger.error(f"No impostor distances for {model_type}.")
+        return None
+    calibration = {
+        'model_type': model_type,
+        'threshold': threshold,
+        'configured_threshold': MODEL_THRESHOLDS[model_type],
+        'target_far': target_far,
+        'far': float(np.mean(impostor[np.isfinite(impostor)] < threshold)),
+        'frr': float(np.mean(genuine >= threshold)),
+        'genuine_samples': int(np.isfinite(genuine).sum()),
+        'impostor_samples': int(np.isfinite(impostor).sum()),
+        'folds': k,
+        'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+    if per_identity:
+        # Keyed by person name: the label ids here follow the face_data listing, while a deployed
+        # model's ids follow its own label map (enrollment appends new ids)
+        thresholds = {}
+        for label_id, name in label_map.items():
+            claims = distances[row_labels != label_id, label_id]
+            if np.isfinite(claims).sum() >= MIN_IDENTITY_IMPOSTORS:
+                thresholds[name] = threshold_for_far(claims, target_far)
+        calibration['per_identity'] = thresholds
+        calibration['per_identity_keys'] = 'name'
+
+    logger.info(f"{model_type}: threshold {threshold:.2f} (configured {MODEL_THRESHOLDS[model_type]}) for FAR "
+                f"{calibration['far']:.4f}, FRR {calibration['frr']:.4f} in {time.perf_counter() - start:.2f}s")
+    return calibration
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate recognition thresholds for a target false-accept rate.")
+    parser.add_argument('--models', nargs='+', choices=MODEL_TYPES, default=['lbph', 'eigen', 'fisher'])
+    parser.add_argument('--target-far', type=float, default=CALIBRATION_TARGET_FAR)
+    parser.add_argument('--per-identity', action='store_true', help="Also calibrate one threshold per person")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--dry-run', action='store_true', help="Print thresholds without saving them")
+    args = parser.parse_args(argv)
+
+    dataset = load_training_data()
+    if dataset[0] is None:
+        return 1
+    results = {}
+    for model_type in args.models:
+        calibration = calibrate(model_type, dataset, args.target_far, args.per_identity, args.folds, args.seed)
+        if calibration is None:
+            continue
+        results[model_type] = calibration
+        if not args.dry_run:
+            save_thresholds(model_type, calibration)
+    print(json.dumps(results, indent=2))
+    return 0 if results else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
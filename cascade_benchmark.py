@@ -0,0 +1,171 @@
+import argparse
+import csv
+import itertools
+import json
+import sys
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from config import *
+from base_engine import FaceEngine
+from frame_source import IMAGE_EXTENSIONS
+from tracker import box_iou
+
+DEFAULT_CASCADES = ['frontalface_default', 'frontalface_alt', 'frontalface_alt2', 'profileface',
+                    'frontalface_default+profileface']
+CSV_FIELDS = ['cascades', 'scale_factor', 'min_neighbors', 'images', 'mean_ms', 'p95_ms',
+              'precision', 'recall', 'true_positives', 'false_positives', 'missed', 'pareto']
+
+
+def load_labeled_set(image_dir, labels_path=None):
+    # Ground truth is a JSON object mapping image file names to lists of [x, y, w, h] face boxes
+    # (full-resolution pixels). Images without an entry are skipped; an empty list means no faces.
+    image_dir = Path(image_dir)
+    labels_path = Path(labels_path) if labels_path else image_dir / 'labels.json'
+    with open(labels_path) as f:
+        labels = json.load(f)
+    samples = []
+    for image_path in sorted(p for p in image_dir.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS):
+        if image_path.name not in labels:
+            continue
+        gray = cv2.imread(str(image_path), cv2.IMREAD_GRAYSCALE)
+        if gray is None:
+            logger.warning(f"Skipping unreadable image {image_path}")
+            continue
+        samples.append((image_path.name, gray, [tuple(box) for box in labels[image_path.name]]))
+    logger.info(f"Loaded {len(samples)} labeled images ({sum(len(s[2]) for s in samples)} faces) from {image_dir}")
+    return samples
+
+
+def match_detections(detections, truths, iou_threshold=0.5):
+    # Greedy one-to-one matching by IoU; returns the number of true positives
+    unmatched = list(truths)
+    matched = 0
+    for detection in detections:
+        best = max(unmatched, key=lambda truth: box_iou(truth, detection), default=None)
+        if best is not None and box_iou(best, detection) >= iou_threshold:
+            unmatched.remove(best)
+            matched += 1
+    return matched
+
+
+def evaluate(engine, samples, scale_factor, min_neighbors, resize=RESIZE_FACTOR, repeats=1):
+    # Detects on each image downscaled by `resize` (as the live pipeline does) and scores the
+    # rescaled boxes against the ground truth
+    times = []
+    tp = fp = missed = 0
+    for _, gray, truths in samples:
+        small = cv2.resize(gray, (gray.shape[1] // resize, gray.shape[0] // resize)) if resize > 1 else gray
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            faces = engine.detect_faces(small, scaleFactor=scale_factor, minNeighbors=min_neighbors)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        times.append(best)
+        detections = [tuple(int(v) * resize for v in face) for face in faces]
+        matched = match_detections(detections, truths)
+        tp += matched
+        fp += len(detections) - matched
+        missed += len(truths) - matched
+
+    ms = np.asarray(times) * 1000
+    return {
+        'images': len(samples),
+        'mean_ms': float(ms.mean()) if len(ms) else 0.0,
+        'p95_ms': float(np.percentile(ms, 95)) if len(ms) else 0.0,
+        'precision': tp / (tp + fp) if tp + fp else 0.0,
+        'recall': tp / (tp + missed) if tp + missed else 0.0,
+        'true_positives': tp,
+        'false_positives': fp,
+        'missed': missed,
+    }
+
+
+def pareto_front(results):
+    # Configurations not beaten by another one that is at least as fast and at least as accurate
+    # (recall, then precision) and strictly better on one of them
+    def dominates(a, b):
+        at_least = a['mean_ms'] <= b['mean_ms'] and a['recall'] >= b['recall'] and a['precision'] >= b['precision']
+        better = a['mean_ms'] < b['mean_ms'] or a['recall'] > b['recall'] or a['precision'] > b['precision']
+        return at_least and better
+    return [r for r in results if not any(dominates(other, r) for other in results if other is not r)]
+
+
+def run_grid(samples, cascade_specs, scale_factors, min_neighbors, resize=RESIZE_FACTOR, repeats=1):
+    results = []
+    for spec in cascade_specs:
+        engine = FaceEngine(spec.split('+'))
+        if len(engine.cascades) != len(spec.split('+')):
+            logger.error(f"Skipping {spec}: cascade could not be loaded.")
+            continue
+        for scale_factor, neighbors in itertools.product(scale_factors, min_neighbors):
+            result = {'cascades': spec, 'scale_factor': scale_factor, 'min_neighbors': neighbors,
+                      **evaluate(engine, samples, scale_factor, neighbors, resize, repeats)}
+            logger.info(f"{spec} sf={scale_factor} mn={neighbors}: {result['mean_ms']:.2f} ms, "
+                        f"P={result['precision']:.3f} R={result['recall']:.3f}")
+            results.append(result)
+
+    front = pareto_front(results)
+    for result in results:
+        result['pareto'] = any(result is r for r in front)
+    return results
+
+
+def cheapest_meeting(results, recall_target):
+    eligible = [r for r in results if r['recall'] >= recall_target]
+    return min(eligible, key=lambda r: r['mean_ms'], default=None)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Latency and precision/recall of every Haar cascade and parameter combination on a labeled image set.")
+    parser.add_argument('images', help="Directory of labeled images")
+    parser.add_argument('--labels', help="Ground-truth JSON (defaults to <images>/labels.json)")
+    parser.add_argument('--cascades', nargs='+', default=DEFAULT_CASCADES,
+                        help="Cascade names or paths; join with '+' for an ensemble, e.g. frontalface_default+profileface")
+    parser.add_argument('--scale-factors', nargs='+', type=float, default=[1.05, 1.1, 1.2, 1.3])
+    parser.add_argument('--min-neighbors', nargs='+', type=int, default=[3, 4, 5, 6])
+    parser.add_argument('--resize', type=int, default=RESIZE_FACTOR, help="Downscale factor applied before detection")
+    parser.add_argument('--repeats', type=int, default=1, help="Time each detection this many times and keep the fastest")
+    parser.add_argument('--recall-target', type=float, default=0.9)
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    parser.add_argument('--csv', dest='csv_path', help="Write one row per configuration as CSV")
+    args = parser.parse_args(argv)
+
+    samples = load_labeled_set(args.images, args.labels)
+    if not samples:
+        logger.error("No labeled images found.")
+        return 1
+
+    results = run_grid(samples, args.cascades, args.scale_factors, args.min_neighbors, args.resize, args.repeats)
+    choice = cheapest_meeting(results, args.recall_target)
+    if choice is None:
+        logger.warning(f"No configuration reaches recall {args.recall_target}.")
+    else:
+        logger.info(f"Cheapest configuration with recall >= {args.recall_target}: {choice['cascades']} "
+                    f"sf={choice['scale_factor']} mn={choice['min_neighbors']} ({choice['mean_ms']:.2f} ms)")
+
+    report = {
+        'images': str(args.images),
+        'resize': args.resize,
+        'recall_target': args.recall_target,
+        'recommended': choice,
+        'pareto_front': [r for r in results if r['pareto']],
+        'results': results,
+    }
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    if args.csv_path:
+        with open(args.csv_path, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,21 +11,112 @@ BASE_DIR = Path(__file__).parent
 FACE_DATA_DIR = BASE_DIR / "face_data"
 TRAINED_DATA_DIR = BASE_DIR / "trained_data"
 HAARCASCADE_DIR = BASE_DIR / "haarcascades"
+PACKED_DATA_DIR = BASE_DIR / "packed_data"
 
 # Files
 CASCADE_PATH = HAARCASCADE_DIR / "haarcascade_frontalface_default.xml"
 
+# Detection
+CASCADES = [CASCADE_PATH]  # Cascade paths or bundled names ('frontalface_alt2', 'profileface'); several form an ensemble
+ENSEMBLE_NMS_IOU = 0.3  # Overlap above which ensemble detections are merged
+MIRROR_PROFILE = True  # Also run profile cascades on the mirrored frame (they only detect one side)
+
 # Parameters
 RESIZE_FACTOR = 4
 FACE_WIDTH, FACE_HEIGHT = 112, 92
 NUM_TRAINING_IMAGES = 100
-CAPTURE_FREQ_DIV = 5
+CAPTURE_INTERVAL = 0.2  # Seconds between captures, so a collection takes NUM_TRAINING_IMAGES * CAPTURE_INTERVAL at any frame rate
+WRITER_QUEUE_SIZE = 64  # Captured faces waiting for the background writer before capture blocks
+WRITER_BATCH_SIZE = 16  # Faces written per batch
+LOADER_WORKERS = None  # Threads decoding face images; None lets the executor pick
+USE_PACKED_DATASET = False  # Collect into and train from the memory-mapped dataset in PACKED_DATA_DIR
+ENROLL_AFTER_COLLECTION = False  # Incrementally enroll new people into already trained models
+
+# Collection Quality Gate (faces that fail are not saved; see face_quality.py to prune face_data)
+QUALITY_GATE = True
+QUALITY_MIN_SHARPNESS = 50  # Laplacian variance below which a face counts as blurred
+QUALITY_BRIGHTNESS_RANGE = (40, 215)  # Accepted mean grey level
+QUALITY_MAX_ASYMMETRY = None  # Mean mirror difference above which a face counts as turned away; None disables
+QUALITY_MIN_HASH_DISTANCE = 4  # dHash bits (of 64) a face must differ by from every kept face
+PRUNED_DATA_DIR = BASE_DIR / "pruned_faces"  # Where face_quality.py moves pruned images
 
 # Research Metrics
 BENCHMARK_WINDOW = 30  # Number of frames to average for performance metrics
 THRESHOLD_LBPH = 80
 THRESHOLD_EIGEN = 4500
 THRESHOLD_FISHER = 500
+USE_CALIBRATED_THRESHOLDS = True  # Prefer thresholds written by calibrate.py over the values above
+CALIBRATION_TARGET_FAR = 0.01  # False-accept rate calibrate.py picks thresholds for
+BATCH_PREDICT = True  # Vectorized NumPy prediction for eigen/fisher instead of per-face model.predict
+
+# Model Storage
+SAVE_BINARY_MODEL = True  # Also write a memory-mappable .npy model store next to each .xml
+MODEL_FORMAT = 'binary'  # 'binary' loads eigen/fisher from the binary store when it is current, 'xml' always parses XML
+
+# Gallery Search
+GALLERY_INDEX = 'ivf'  # 'ivf' (approximate, k-means coarse quantizer) or 'exact'
+GALLERY_INDEX_MIN_SIZE = 2000  # Smaller galleries always use exact search
+IVF_NLIST = None  # Number of IVF cells; None picks sqrt(gallery size)
+IVF_NPROBE = 8  # Cells visited per query
+
+# Tracking (detect once, track between detections)
+TRACKING_MODE = False
+TRACK_DETECT_EVERY = 10  # Full detection every N frames
+TRACK_MIN_SCORE = 0.6  # Template match score below which a track is considered lost
+TRACK_SEARCH_MARGIN = 0.5  # Search window around the previous box, as a fraction of its size
+TRACK_MATCH_IOU = 0.3  # Minimum overlap to keep a track's identity on re-detection
+TRACK_REIDENTIFY_DIFF = 25  # Mean grey-level change that triggers a new prediction for a track
+
+# Adaptive Detection (ROI search around previous faces, downscale picked from observed face sizes)
+ADAPTIVE_DETECTION = False
+ADAPTIVE_FULL_SCAN_EVERY = 15  # Full-frame scan every N frames; ROI-only scans in between
+ADAPTIVE_ROI_MARGIN = 0.5  # ROI around a previous face, as a fraction of its size
+ADAPTIVE_SIZE_TOLERANCE = 0.25  # Allowed frame-to-frame change in face size inside an ROI
+ADAPTIVE_SIZE_HISTORY = 30  # Recent face sizes used to choose the full-scan downscale factor
+ADAPTIVE_MAX_DOWNSCALE = 8
+
+# dlib Baseline
+DLIB_GALLERY_PATH = TRAINED_DATA_DIR / "dlib_gallery.npz"  # Cached encodings of face_data (see dlib_gallery.py)
+DLIB_TOLERANCE = 0.6  # Maximum encoding distance for a match (face_recognition's default)
+KNOWN_FACE_IMAGES = {"mayank": BASE_DIR / "known_face.jpeg"}  # Full photos added to the gallery besides face_data
+DLIB_DETECTION_MODEL = 'hog'  # 'hog' (CPU) or 'cnn' (much slower without a GPU)
+DLIB_TARGET_FPS = 15  # Display rate the frame stride aims for; skipped frames reuse the last results
+DLIB_MAX_STRIDE = 8
+DLIB_FRAME_STRIDE = None  # None: stride follows measured latency; an int processes every Nth frame
+
+# Multi-stream Server
+STREAM_MAX_IN_FLIGHT = 2  # Frames per stream waiting for or inside a worker before frames are dropped
+STREAM_REPORT_INTERVAL = 5  # Seconds between FPS reports
+
+# Pipelined Capture (capture, preprocess, detect, recognize and display on separate threads)
+PIPELINE_MODE = False
+PIPELINE_QUEUE_SIZE = 1  # Frames buffered between stages; when full the oldest frame is dropped
+
+# Frame Buffers
+REUSE_FRAME_BUFFERS = True  # Write per-frame conversions and face crops into preallocated arrays
+
+# Shared Model Host (see model_host.py)
+USE_MODEL_HOST = True  # Recognizers attach to a running model host and fall back to loading the model themselves
+MODEL_HOST_PREFIX = "face_model"  # Shared memory segment names: <prefix>_<model> (control) and <prefix>_<model>_v<n> (arrays)
+MODEL_HOST_POLL_INTERVAL = 2.0  # Seconds between checks of trained_data for retrained models
+MODEL_HOST_HEARTBEAT_TIMEOUT = 10.0  # Seconds without a host heartbeat before recognizers load the model themselves
+MODEL_HOST_CONTROL_SIZE = 1 << 20  # Bytes reserved for a model's descriptor and label map
+
+# Local Recognition API (see recognition_api.py)
+API_HOST = "127.0.0.1"  # Localhost only: the API has no authentication
+API_PORT = 8765
+API_MAX_BATCH = 16  # Requests coalesced into one detect/predict batch
+API_MAX_WAIT_MS = 5  # Longest a request waits for others to join its batch
+API_MAX_BODY = 16 * 2 ** 20  # Largest accepted image in bytes
+
+# Hot Reload (recognizers pick up retrained models without restarting)
+HOT_RELOAD = True
+HOT_RELOAD_INTERVAL = 2.0  # Seconds between checks of the model files; a retrain is loaded once they stop changing
+
+# Instrumentation (timing spans for decode, convert, resize, detect, predict, draw, ...)
+INSTRUMENTATION = os.environ.get("FACE_INSTRUMENT") == "1"  # Off: spans cost one attribute check
+INSTRUMENT_BUFFER_SIZE = 4096  # Most recent samples kept per span
+TRACE_DIR = BASE_DIR / "traces"  # Chrome-trace dumps of instrumented runs
 
 # Ensure directories exist
 for directory in [FACE_DATA_DIR, TRAINED_DATA_DIR]:
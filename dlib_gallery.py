@@ -0,0 +1,139 @@
+import argparse
+import hashlib
+import sys
+import time
+import cv2
+import numpy as np
+import face_recognition
+from pathlib import Path
+from config import *
+from frame_source import IMAGE_EXTENSIONS
+
+
+def content_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def encode_image(path):
+    # 128-d dlib encoding of one image. face_data crops are already aligned face images, so
+    # the whole crop is the face location; full photos go through HOG detection first.
+    image = face_recognition.load_image_file(str(path))
+    if image.shape[:2] == (FACE_HEIGHT, FACE_WIDTH):
+        locations = [(0, image.shape[1], image.shape[0], 0)]
+    else:
+        locations = face_recognition.face_locations(image)[:1]
+    if not locations:
+        return None
+    encodings = face_recognition.face_encodings(image, locations)
+    return np.asarray(encodings[0], dtype=np.float32) if encodings else None
+
+
+# Stacked dlib encodings (N x 128 float32) with the person name and source-image content hash
+# of every row. Loading is one .npz read and matching is one distance computation per frame,
+# whatever the number of enrolled images.
+class DlibGallery:
+    def __init__(self, encodings=None, names=None, hashes=None):
+        self.encodings = np.asarray(encodings if encodings is not None else np.empty((0, 128)), dtype=np.float32)
+        self.names = np.asarray(names if names is not None else [], dtype=str)
+        self.hashes = np.asarray(hashes if hashes is not None else [], dtype=str)
+        self.squared_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    @classmethod
+    def load(cls, path=DLIB_GALLERY_PATH):
+        if not Path(path).exists():
+            return None
+        data = np.load(path)
+        return cls(data['encodings'], data['names'], data['hashes'])
+
+    def save(self, path=DLIB_GALLERY_PATH):
+        # np.savez appends .npz to names without it, so write to a .npz temp file and swap it in
+        path = Path(path)
+        tmp_path = path.with_name(path.stem + '.tmp.npz')
+        np.savez(tmp_path, encodings=self.encodings, names=self.names, hashes=self.hashes)
+        tmp_path.replace(path)
+
+    def distances(self, encodings):
+        # Euclidean distances between every query encoding and every gallery row
+        queries = np.asarray(encodings, dtype=np.float32).reshape(-1, 128)
+        sq = (np.einsum('ij,ij->i', queries, queries)[:, None] + self.squared_norms[None, :]
+              - 2.0 * queries @ self.encodings.T)
+        return np.sqrt(np.maximum(sq, 0.0))
+
+    def nearest(self, encodings):
+        # Index of and distance to the closest gallery row for every query
+        distances = self.distances(encodings)
+        rows = distances.argmin(axis=1)
+        return rows, distances[np.arange(len(rows)), rows]
+
+    def match(self, encodings, tolerance=DLIB_TOLERANCE):
+        # Returns [(name, distance)] per query; "Unknown" when the nearest row is beyond tolerance
+        if len(encodings) == 0:
+            return []
+        if len(self) == 0:
+            return [("Unknown", float('inf'))] * len(encodings)
+        rows, best = self.nearest(encodings)
+        return [(str(self.names[i]) if d <= tolerance else "Unknown", float(d)) for i, d in zip(rows, best)]
+
+
+def gallery_sources(face_data_dir=FACE_DATA_DIR, extra_images=KNOWN_FACE_IMAGES):
+    # (name, path) for every face_data image plus the configured full photos
+    sources = []
+    for person_dir in sorted(d for d in Path(face_data_dir).iterdir() if d.is_dir()):
+        sources.extend((person_dir.name, p) for p in sorted(person_dir.iterdir()) if p.suffix.lower() in IMAGE_EXTENSIONS)
+    sources.extend((name, Path(path)) for name, path in extra_images.items() if Path(path).exists())
+    return sources
+
+
+def build_gallery(face_data_dir=FACE_DATA_DIR, path=DLIB_GALLERY_PATH, extra_images=KNOWN_FACE_IMAGES):
+    # Incremental: images whose content hash is already cached keep their encoding, so only new
+    # or changed images go through dlib; images that disappeared are dropped
+    start = time.perf_counter()
+    cached = DlibGallery.load(path) or DlibGallery()
+    by_hash = {h: e for h, e in zip(cached.hashes, cached.encodings)}
+
+    encodings, names, hashes = [], [], []
+    encoded = skipped = 0
+    for name, image_path in gallery_sources(face_data_dir, extra_images):
+        digest = content_hash(image_path)
+        encoding = by_hash.get(digest)
+        if encoding is None:
+            encoding = encode_image(image_path)
+            encoded += 1
+            if encoding is None:
+                skipped += 1
+                logger.warning(f"No face found in {image_path}")
+                continue
+        encodings.append(encoding)
+        names.append(name)
+        hashes.append(digest)
+
+    gallery = DlibGallery(np.vstack(encodings) if encodings else None, names, hashes)
+    gallery.save(path)
+    logger.info(f"dlib gallery: {len(gallery)} encodings of {len(set(names))} people, {encoded} newly encoded "
+                f"({skipped} without a face) in {time.perf_counter() - start:.2f}s")
+    return gallery
+
+
+def load_or_build_gallery(path=DLIB_GALLERY_PATH):
+    gallery = DlibGallery.load(path)
+    if gallery is None:
+        logger.info("No dlib gallery cache found; building it.")
+        gallery = build_gallery(path=path)
+    return gallery
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or refresh the cached dlib face-encoding gallery.")
+    parser.add_argument('--source', type=Path, default=FACE_DATA_DIR)
+    parser.add_argument('--output', type=Path, default=DLIB_GALLERY_PATH)
+    args = parser.parse_args(argv)
+    gallery = build_gallery(args.source, args.output)
+    return 0 if len(gallery) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
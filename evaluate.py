@@ -0,0 +1,204 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from config import *
+from gallery_index import pairwise_distances
+from lbph_numpy import LBPHPredictor
+from subspace_predictor import SubspacePredictor
+from training_logic import FaceTrainer, load_thresholds, load_training_data
+
+MODEL_TYPES = ['lbph', 'lbph_numpy', 'eigen', 'fisher']
+MODEL_THRESHOLDS = {'lbph': THRESHOLD_LBPH, 'lbph_numpy': THRESHOLD_LBPH,
+                    'eigen': THRESHOLD_EIGEN, 'fisher': THRESHOLD_FISHER}
+
+
+def operating_threshold(model_type):
+    # The threshold FaceRecognizer applies: calibrated when available, otherwise from config
+    calibrated = load_thresholds(model_type) if USE_CALIBRATED_THRESHOLDS else None
+    return calibrated[0] if calibrated is not None else MODEL_THRESHOLDS[model_type]
+
+
+def split_folds(labels, k, seed=0):
+    # Assigns every sample to one of k folds, splitting each person's samples evenly
+    rng = np.random.default_rng(seed)
+    folds = np.empty(len(labels), dtype=np.int32)
+    for label_id in np.unique(labels):
+        indices = rng.permutation(np.flatnonzero(labels == label_id))
+        for fold, chunk in enumerate(np.array_split(indices, k)):
+            folds[chunk] = fold
+    return folds
+
+
+def gallery_and_queries(model_type, model, test_images):
+    # Gallery vectors, query vectors and metric, as the model itself compares them
+    if model_type in ('lbph', 'lbph_numpy'):
+        predictor = LBPHPredictor.from_model(model)
+        return predictor.index.vectors, predictor.features(test_images).astype(np.float64), 'chisqr'
+    predictor = SubspacePredictor.from_model(model)
+    return predictor.projections, predictor.project(test_images), 'l2'
+
+
+def time_prediction(model_type, model, test_images):
+    # Per-face latency of the prediction path FaceRecognizer uses for this model type
+    if model_type in ('eigen', 'fisher') and BATCH_PREDICT:
+        predictor = SubspacePredictor.from_model(model)
+        start = time.perf_counter()
+        predictor.predict(test_images)
+    elif model_type == 'lbph_numpy':
+        predictor = LBPHPredictor.from_model(model)
+        start = time.perf_counter()
+        predictor.predict(test_images)
+    else:
+        start = time.perf_counter()
+        for face in test_images:
+            model.predict(face)
+    return (time.perf_counter() - start) / len(test_images)
+
+
+def score_queries(distances, gallery_labels, test_labels):
+    # Genuine score: distance to the nearest sample of the true identity. Impostor score: distance
+    # to the nearest sample of any other identity, i.e. what an unenrolled person would get.
+    same = gallery_labels[None, :] == test_labels[:, None]
+    genuine = np.where(same, distances, np.inf).min(axis=1)
+    impostor = np.where(same, np.inf, distances).min(axis=1)
+    predicted = gallery_labels[distances.argmin(axis=1)]
+    return genuine, impostor, predicted
+
+
+def error_rates(genuine, impostor, threshold):
+    # A face is accepted when its distance is below the threshold (as in FaceRecognizer)
+    far = float(np.mean(impostor[np.isfinite(impostor)] < threshold)) if np.isfinite(impostor).any() else 0.0
+    frr = float(np.mean(genuine >= threshold)) if len(genuine) else 0.0
+    return far, frr
+
+
+def roc_curve(genuine, impostor, points=50):
+    # FAR/FRR over thresholds spanning both distance distributions, plus the equal error rate
+    # People without training samples in a fold have no finite genuine score
+    genuine, impostor = genuine[np.isfinite(genuine)], impostor[np.isfinite(impostor)]
+    scores = np.concatenate([genuine, impostor])
+    if len(scores) == 0:
+        return [], None
+    thresholds = np.unique(np.quantile(scores, np.linspace(0, 1, points)))
+    curve = []
+    for threshold in thresholds:
+        far, frr = error_rates(genuine, impostor, threshold)
+        curve.append({'threshold': float(threshold), 'far': far, 'frr': frr, 'tar': 1.0 - frr})
+    eer_point = min(curve, key=lambda p: abs(p['far'] - p['frr']), default=None)
+    eer = (eer_point['far'] + eer_point['frr']) / 2 if eer_point else None
+    return curve, eer
+
+
+# Dataset handed to fold workers, inherited (fork) or copied once per worker (spawn)
+_eval_dataset = None
+
+
+def _init_eval_worker(dataset):
+    global _eval_dataset
+    _eval_dataset = dataset
+
+
+def _evaluate_fold(fold, model_types):
+    images, labels, folds = _eval_dataset
+    train, test = folds != fold, folds == fold
+    train_images, train_labels = np.asarray(images[train]), labels[train]
+    test_images, test_labels = np.asarray(images[test]), labels[test]
+    results = {}
+    for model_type in model_types:
+        if model_type == 'fisher' and len(np.unique(train_labels)) < 2:
+            continue
+        model = FaceTrainer(model_type).model
+        start = time.perf_counter()
+        model.train(list(train_images), train_labels)
+        train_s = time.perf_counter() - start
+
+        vectors, queries, metric = gallery_and_queries(model_type, model, test_images)
+        gallery_labels = np.asarray(model.getLabels()).reshape(-1)
+        genuine, impostor, predicted = score_queries(pairwise_distances(queries, vectors, metric), gallery_labels, test_labels)
+        results[model_type] = {
+            'fold': fold,
+            'train_images': int(train.sum()),
+            'test_images': int(test.sum()),
+            'train_s': train_s,
+            'predict_ms_per_face': time_prediction(model_type, model, test_images) * 1000,
+            'accuracy': float(np.mean(predicted == test_labels)),
+            'genuine': genuine.tolist(),
+            'impostor': impostor.tolist(),
+        }
+    return results
+
+
+def evaluate(k=5, model_types=('lbph', 'eigen', 'fisher'), workers=None, seed=0, roc_points=50):
+    images, labels, label_map = load_training_data()
+    if images is None:
+        return None
+    labels = np.asarray(labels)
+    if np.bincount(labels).min() < k:
+        logger.warning(f"Some people have fewer than {k} images; their empty folds are skipped.")
+    folds = split_folds(labels, k, seed)
+
+    start = time.perf_counter()
+    fold_results = []
+    with ProcessPoolExecutor(max_workers=workers or k, initializer=_init_eval_worker,
+                             initargs=((images, labels, folds),)) as executor:
+        for result in executor.map(_evaluate_fold, range(k), [tuple(model_types)] * k):
+            fold_results.append(result)
+    logger.info(f"Evaluated {k} folds in {time.perf_counter() - start:.2f}s")
+
+    report = {'folds': k, 'seed': seed, 'people': len(label_map), 'images': int(len(labels)), 'models': {}}
+    for model_type in model_types:
+        per_fold = [result[model_type] for result in fold_results if model_type in result]
+        if not per_fold:
+            continue
+        genuine = np.concatenate([np.asarray(f.pop('genuine')) for f in per_fold])
+        impostor = np.concatenate([np.asarray(f.pop('impostor')) for f in per_fold])
+        threshold = operating_threshold(model_type)
+        far, frr = error_rates(genuine, impostor, threshold)
+        curve, eer = roc_curve(genuine, impostor, roc_points)
+        accuracies = [f['accuracy'] for f in per_fold]
+        report['models'][model_type] = {
+            'threshold': threshold,
+            'accuracy': float(np.mean(accuracies)),
+            'accuracy_std': float(np.std(accuracies)),
+            'far': far,
+            'frr': frr,
+            'eer': eer,
+            'train_s': float(np.mean([f['train_s'] for f in per_fold])),
+            'predict_ms_per_face': float(np.mean([f['predict_ms_per_face'] for f in per_fold])),
+            'roc': curve,
+            'per_fold': per_fold,
+        }
+        logger.info(f"{model_type}: accuracy {np.mean(accuracies):.3f}, FAR {far:.3f}, FRR {frr:.3f} at {threshold}"
+                    + (f", EER {eer:.3f}" if eer is not None else ""))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="k-fold accuracy, FAR/FRR, ROC and latency evaluation over face_data.")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--models', nargs='+', choices=MODEL_TYPES, default=['lbph', 'eigen', 'fisher'])
+    parser.add_argument('--workers', type=int, default=None, help="Folds evaluated in parallel (default: one per fold)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--roc-points', type=int, default=50)
+    parser.add_argument('--json', dest='json_path', help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    if args.folds < 2:
+        parser.error("--folds must be at least 2")
+    report = evaluate(args.folds, args.models, args.workers, args.seed, args.roc_points)
+    if report is None:
+        return 1
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Report written to {args.json_path}")
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+import argparse
+import json
+import shutil
+import sys
+import cv2
+import numpy as np
+from pathlib import Path
+from config import *
+from frame_source import IMAGE_EXTENSIONS
+
+
+def sharpness(face):
+    # Variance of the Laplacian: low for blurred or out-of-focus faces
+    return float(cv2.Laplacian(face, cv2.CV_64F).var())
+
+
+def brightness(face):
+    return float(face.mean())
+
+
+def asymmetry(face):
+    # Mean left/right mirror difference; grows as the face turns away from the camera
+    return float(cv2.absdiff(face, cv2.flip(face, 1)).mean())
+
+
+def difference_hash(face):
+    # 64-bit dHash (brightness gradients of a 9x8 thumbnail) packed into 8 bytes
+    thumb = cv2.resize(face, (9, 8), interpolation=cv2.INTER_AREA)
+    return np.packbits(thumb[:, 1:] > thumb[:, :-1])
+
+
+def hamming_distances(hash_, hashes):
+    # Bit differences between one hash and every row of an (N, 8) hash array
+    if len(hashes) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.unpackbits(np.bitwise_xor(hashes, hash_), axis=1).sum(axis=1)
+
+
+# Accepts a face only if it is sharp, well exposed, near-frontal (when QUALITY_MAX_ASYMMETRY is
+# set) and not a near-duplicate of a face that was already kept.
+class QualityGate:
+    def __init__(self, min_sharpness=QUALITY_MIN_SHARPNESS, brightness_range=QUALITY_BRIGHTNESS_RANGE,
+                 max_asymmetry=QUALITY_MAX_ASYMMETRY, min_hash_distance=QUALITY_MIN_HASH_DISTANCE):
+        self.min_sharpness = min_sharpness
+        self.brightness_range = brightness_range
+        self.max_asymmetry = max_asymmetry
+        self.min_hash_distance = min_hash_distance
+        self.hashes = np.empty((0, 8), dtype=np.uint8)
+        self.rejected = {'blur': 0, 'exposure': 0, 'pose': 0, 'duplicate': 0}
+
+    def assess(self, face):
+        # Returns (reason or None, scores); the face is not remembered until keep() is called
+        scores = {'sharpness': sharpness(face), 'brightness': brightness(face)}
+        if scores['sharpness'] < self.min_sharpness:
+            return 'blur', scores
+        low, high = self.brightness_range
+        if not low <= scores['brightness'] <= high:
+            return 'exposure', scores
+        if self.max_asymmetry is not None:
+            scores['asymmetry'] = asymmetry(face)
+            if scores['asymmetry'] > self.max_asymmetry:
+                return 'pose', scores
+        scores['hash'] = difference_hash(face)
+        distances = hamming_distances(scores['hash'], self.hashes)
+        scores['nearest'] = int(distances.min()) if len(distances) else None
+        if len(distances) and distances.min() < self.min_hash_distance:
+            return 'duplicate', scores
+        return None, scores
+
+    def keep(self, face_hash):
+        self.hashes = np.vstack([self.hashes, face_hash[None, :]])
+
+    def accept(self, face):
+        # assess() and keep() in one step; counts rejections by reason
+        reason, scores = self.assess(face)
+        if reason is None:
+            self.keep(scores['hash'])
+            return True
+        self.rejected[reason] += 1
+        return False
+
+
+def image_paths(person_dir):
+    return sorted(p for p in Path(person_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def gate_for_existing(person_dir, gate=None):
+    # A gate that already knows the faces saved in person_dir, so new captures are not duplicates of them
+    gate = gate or QualityGate()
+    for path in image_paths(person_dir):
+        face = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if face is not None:
+            gate.keep(difference_hash(face))
+    return gate
+
+
+def gate_for_packed(packed, person_name, gate=None):
+    # Same as gate_for_existing for a person's faces in a PackedDataset
+    gate = gate or QualityGate()
+    for face in packed.faces_of(person_name):
+        gate.keep(difference_hash(face))
+    return gate
+
+
+def prune_person(person_dir, pruned_dir=PRUNED_DATA_DIR, dry_run=False, delete=False):
+    # Keeps the sharpest faces first, then every face that passes the gate; the rest is moved to
+    # pruned_dir/<person> (or deleted). Returns a summary.
+    gate = QualityGate()
+    faces = []
+    for path in image_paths(person_dir):
+        face = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+        if face is None:
+            logger.warning(f"Skipping unreadable image {path}")
+            continue
+        faces.append((sharpness(face), path, face))
+    faces.sort(key=lambda item: -item[0])
+
+    removed = []
+    for _, path, face in faces:
+        if not gate.accept(face):
+            removed.append(path)
+
+    if not dry_run:
+        target = Path(pruned_dir) / Path(person_dir).name
+        for path in removed:
+            if delete:
+                path.unlink()
+            else:
+                target.mkdir(parents=True, exist_ok=True)
+                shutil.move(str(path), str(target / path.name))
+    return {'images': len(faces), 'kept': len(faces) - len(removed), 'removed': len(removed), 'rejected': gate.rejected}
+
+
+def prune(face_data_dir=FACE_DATA_DIR, people=None, pruned_dir=PRUNED_DATA_DIR, dry_run=False, delete=False):
+    report = {}
+    for person_dir in sorted(d for d in Path(face_data_dir).iterdir() if d.is_dir()):
+        if people and person_dir.name not in people:
+            continue
+        report[person_dir.name] = summary = prune_person(person_dir, pruned_dir, dry_run, delete)
+        logger.info(f"{person_dir.name}: kept {summary['kept']}/{summary['images']} ({summary['rejected']})")
+    removed = sum(s['removed'] for s in report.values())
+    if removed and not dry_run:
+        logger.info(f"Removed {removed} images; retrain the models to shrink their galleries.")
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prune blurred, badly exposed and near-duplicate faces from face_data.")
+    parser.add_argument('--people', nargs='+', help="Only these person directories (default: all)")
+    parser.add_argument('--source', type=Path, default=FACE_DATA_DIR)
+    parser.add_argument('--pruned-dir', type=Path, default=PRUNED_DATA_DIR, help="Where removed images are moved")
+    parser.add_argument('--delete', action='store_true', help="Delete removed images instead of moving them")
+    parser.add_argument('--dry-run', action='store_true', help="Only report what would be removed")
+    args = parser.parse_args(argv)
+
+    report = prune(args.source, args.people, args.pruned_dir, args.dry_run, args.delete)
+    print(json.dumps(report, indent=2))
+    return 0 if report else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from config import *
+from instrumentation import instruments
+
+_CLOSE = object()
+
+
+def next_image_index(person_dir):
+    # One past the highest numeric file name in person_dir (1 for an empty or missing directory)
+    if person_dir is None or not person_dir.exists():
+        return 1
+    return max((int(p.stem) for p in person_dir.iterdir() if p.stem.isdigit()), default=0) + 1
+
+
+# Writes captured faces on a background thread so PNG encoding and filesystem latency stay out
+# of the capture loop. Faces queued while a batch is being written are written together: PNGs
+# in one pass, packed records with a single append. The queue is bounded; when it is full,
+# submit() blocks, which slows capture down rather than buffering without limit.
+class FaceWriter(threading.Thread):
+    def __init__(self, person_name, person_dir=None, packed=None, queue_size=WRITER_QUEUE_SIZE,
+                 batch_size=WRITER_BATCH_SIZE):
+        super().__init__(name=f"face-writer-{person_name}", daemon=True)
+        self.person_name = person_name
+        self.person_dir = person_dir
+        self.packed = packed
+        self.batch_size = batch_size
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_stall = 0.0
+        # Every face written this session, for enrolling exactly these into trained models
+        self.faces = []
+        # Numbering continues after the images already in person_dir, so a second collection never overwrites them
+        self.next_index = next_image_index(person_dir) if packed is None else None
+        self.start()
+
+    def submit(self, face):
+        # The face is copied: capture crops live in reused scratch buffers
+        start = time.perf_counter()
+        self.queue.put(face.copy())
+        self.max_stall = max(self.max_stall, time.perf_counter() - start)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            batch = [] if item is _CLOSE else [item]
+            while item is not _CLOSE and len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not _CLOSE:
+                    batch.append(item)
+            if batch:
+                self.write_batch(batch)
+            if item is _CLOSE:
+                return
+
+    def write_batch(self, batch):
+        with instruments.span('save'):
+            try:
+                if self.packed is not None:
+                    self.packed.append(self.person_name, np.stack(batch))
+                    self.written += len(batch)
+                    self.faces.extend(batch)
+                else:
+                    for face in batch:
+                        if cv2.imwrite(str(self.free_path()), face):
+                            self.written += 1
+                            self.faces.append(face)
+                        else:
+                            self.failed += 1
+                self.batches += 1
+            except Exception as e:
+                logger.error(f"Writing {len(batch)} faces failed: {e}")
+                self.failed += len(batch)
+
+    def free_path(self):
+        # Skips names that appeared since the writer started (e.g. a collection running in parallel)
+        while (self.person_dir / f"{self.next_index}.png").exists():
+            self.next_index += 1
+        path = self.person_dir / f"{self.next_index}.png"
+        self.next_index += 1
+        return path
+
+    def close(self):
+        # Flushes everything queued so far and stops the thread
+        self.queue.put(_CLOSE)
+        self.join()
+        logger.info(f"Writer: {self.written} faces in {self.batches} batches, {self.failed} failed, "
+                    f"longest capture-loop stall {self.max_stall * 1000:.1f} ms")
+        return self.written
@@ -0,0 +1,39 @@
+import numpy as np
+from config import *
+
+
+# Destination arrays reused across frames, so the per-frame OpenCV calls (flip, cvtColor, resize,
+# face crops) write into memory allocated once instead of allocating fresh arrays every frame.
+# Buffers are reallocated only when the frame size changes. Results stay valid until the next
+# frame, so anything kept longer (track templates, queued pipeline packets) must be copied.
+class FrameBuffers:
+    def __init__(self, resize_factor=RESIZE_FACTOR, face_size=(FACE_HEIGHT, FACE_WIDTH)):
+        self.resize_factor = resize_factor
+        self.face_size = face_size
+        self.shape = None
+        self.faces = np.empty((0, *face_size), dtype=np.uint8)
+        self.allocations = 0
+
+    def frame(self, shape):
+        # Buffers for one frame of the given (h, w, 3) shape
+        if shape != self.shape:
+            height, width = shape[:2]
+            small = (height // self.resize_factor, width // self.resize_factor)
+            self.display = np.empty(shape, dtype=np.uint8)
+            self.gray = np.empty((height, width), dtype=np.uint8)
+            # Unmirrored gray, used when the colour frame is not flipped for display
+            self.capture_gray = np.empty((height, width), dtype=np.uint8)
+            self.small_gray = np.empty(small, dtype=np.uint8)
+            self.small_color = np.empty((*small, 3), dtype=np.uint8)
+            self.small_rgb = np.empty((*small, 3), dtype=np.uint8)
+            self.shape = shape
+            self.allocations += 1
+        return self
+
+    def face(self, i):
+        # The i-th FACE_HEIGHT x FACE_WIDTH scratch crop; the pool grows to the most faces seen in a frame
+        if i >= len(self.faces):
+            # Crops already handed out keep referencing the old pool, so nothing is copied
+            self.faces = np.empty((max(i + 1, 2 * len(self.faces)), *self.face_size), dtype=np.uint8)
+            self.allocations += 1
+        return self.faces[i]
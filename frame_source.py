@@ -0,0 +1,95 @@
+import cv2
+import time
+from pathlib import Path
+from config import logger
+from instrumentation import instruments
+
+DEFAULT_SOURCE_FPS = 25  # Pacing rate for image directories in realtime mode
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff'}
+
+
+# Iterates BGR frames from a camera index, a stream URL, a video file or a directory of images,
+# so the same processing code can run live or replay recorded data headless.
+class FrameSource:
+    def __init__(self, source, loop=False, realtime=False, fps=DEFAULT_SOURCE_FPS):
+        self.source = source
+        self.loop = loop
+        # Realtime pacing makes recorded files behave like live cameras (frames arrive at source FPS)
+        self.realtime = realtime
+        self.fps = fps
+        self.image_paths = None
+        self.capture = None
+
+        path = Path(str(source))
+        if path.is_dir():
+            self.image_paths = sorted(p for p in path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            if not self.image_paths:
+                raise ValueError(f"No images found in {path}")
+        elif str(source).isdigit():
+            self.capture = cv2.VideoCapture(int(source))
+        elif '://' in str(source):
+            # Network streams (rtsp://, http://) are handed to OpenCV as-is
+            self.capture = cv2.VideoCapture(str(source))
+        else:
+            if not path.exists():
+                raise ValueError(f"Frame source {path} does not exist")
+            self.capture = cv2.VideoCapture(str(path))
+
+        if self.capture is not None and not self.capture.isOpened():
+            raise ValueError(f"Could not open frame source {source}")
+        if self.capture is not None and self.capture.get(cv2.CAP_PROP_FPS) > 0:
+            self.fps = self.capture.get(cv2.CAP_PROP_FPS)
+
+    @property
+    def name(self):
+        return Path(str(self.source)).name or str(self.source)
+
+    def __iter__(self):
+        if not self.realtime:
+            return self._frames()
+        return self._paced(self._frames())
+
+    def _paced(self, frames):
+        interval = 1.0 / self.fps
+        next_time = time.perf_counter()
+        for frame in frames:
+            delay = next_time - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            next_time = max(next_time + interval, time.perf_counter() - interval)
+            yield frame
+
+    def _frames(self):
+        if self.image_paths is not None:
+            while True:
+                for img_path in self.image_paths:
+                    with instruments.span('decode'):
+                        frame = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
+                    if frame is None:
+                        logger.warning(f"Skipping unreadable image {img_path}")
+                        continue
+                    yield frame
+                if not self.loop:
+                    return
+        else:
+            yielded = False
+            while True:
+                with instruments.span('decode'):
+                    ret, frame = self.capture.read()
+                if not ret or frame is None:
+                    if self.loop and yielded and self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0):
+                        yielded = False
+                        continue
+                    return
+                yielded = True
+                yield frame
+
+    def release(self):
+        if self.capture is not None:
+            self.capture.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
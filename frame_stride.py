@@ -0,0 +1,42 @@
+import math
+from config import *
+
+
+# Decides which frames go through an expensive recognizer. With a fixed stride every Nth frame is
+# processed; otherwise the stride follows the measured per-frame latency (smoothed), so frames
+# are skipped just often enough to keep the display near `target_fps`. Skipped frames reuse the
+# last results.
+class FrameStride:
+    def __init__(self, target_fps=DLIB_TARGET_FPS, max_stride=DLIB_MAX_STRIDE, fixed=DLIB_FRAME_STRIDE, smoothing=0.2):
+        self.frame_budget = 1.0 / target_fps
+        self.max_stride = max_stride
+        self.fixed = fixed
+        self.smoothing = smoothing
+        self.latency = None
+        self.stride = fixed or 1
+        self.countdown = 0
+        self.processed = 0
+        self.skipped = 0
+
+    def should_process(self):
+        if self.countdown > 0:
+            self.countdown -= 1
+            self.skipped += 1
+            return False
+        self.countdown = self.stride - 1
+        return True
+
+    def record(self, seconds):
+        # Latency of one processed frame; updates the stride used from the next frame on
+        self.processed += 1
+        self.latency = seconds if self.latency is None else self.smoothing * seconds + (1 - self.smoothing) * self.latency
+        if not self.fixed:
+            self.stride = min(self.max_stride, max(1, math.ceil(self.latency / self.frame_budget)))
+
+    def stats(self):
+        return {
+            'stride': self.stride,
+            'latency_ms': self.latency * 1000 if self.latency is not None else None,
+            'processed': self.processed,
+            'skipped': self.skipped,
+        }
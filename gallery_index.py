@@ -0,0 +1,302 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+from config import *
+
+
+def pairwise_distances(queries, vectors, metric='l2', vector_sums=None):
+    # Distances between every query row and every gallery row
+    if metric == 'l2':
+        sq_dists = (np.einsum('ij,ij->i', queries, queries)[:, None]
+                    + np.einsum('ij,ij->i', vectors, vectors)[None, :]
+                    - 2.0 * queries @ vectors.T)
+        return np.sqrt(np.maximum(sq_dists, 0.0, out=sq_dists))
+    if metric == 'chisqr':
+        # HISTCMP_CHISQR_ALT as used by LBPH: 2 * sum((a - b)^2 / (a + b)) over non-negative histograms.
+        # (a - b)^2 / (a + b) == a + b - 4ab / (a + b), and the last term vanishes wherever the query bin
+        # is zero, so only the query's occupied bins are visited. LBP histograms are mostly empty.
+        if vector_sums is None:
+            vector_sums = vectors.sum(axis=1)
+        distances = np.empty((len(queries), len(vectors)), dtype=np.float64)
+        for i, query in enumerate(queries):
+            nonzero = np.flatnonzero(query)
+            a = query[nonzero]
+            cross = np.empty(len(vectors), dtype=np.float64)
+            # Gallery rows are processed in cache-sized blocks to avoid large temporaries
+            chunk = max(1, 2 ** 16 // max(1, len(nonzero)))
+            for start in range(0, len(vectors), chunk):
+                # Float32 histograms are widened per block; sums are always accumulated in float64
+                b = vectors[start:start + chunk, nonzero].astype(np.float64, copy=False)
+                total = b + a
+                b *= a
+                b /= total
+                cross[start:start + chunk] = b.sum(axis=1)
+            distances[i] = 2.0 * (vector_sums + a.sum() - 4.0 * cross)
+        return distances
+    raise ValueError(f"Unknown metric: {metric}")
+
+
+def paired_distances(queries, vectors, metric='l2'):
+    # Row-wise distances between queries[i] and vectors[i]; exact, unlike the expanded L2 form above
+    if metric == 'l2':
+        return np.linalg.norm(queries - vectors, axis=1)
+    diff = queries - vectors
+    total = queries + vectors
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(total > np.finfo(np.float64).eps, diff * diff / total, 0.0)
+    return 2.0 * terms.sum(axis=1)
+
+
+# Brute-force search over every gallery vector; the reference all approximate indexes are measured against
+class ExactIndex:
+    kind = 'exact'
+
+    def __init__(self, vectors, labels, metric='l2'):
+        # LBP histograms (chi-square) stay float32 as OpenCV and the binary store keep them, so a
+        # memory-mapped gallery is searched in place instead of being copied to float64
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32 if metric == 'chisqr' else np.float64)
+        self.labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self.metric = metric
+        if len(self.vectors) != len(self.labels):
+            raise ValueError("Gallery vectors and labels have different lengths")
+        self.vector_sums = self.vectors.sum(axis=1, dtype=np.float64) if metric == 'chisqr' else None
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, queries):
+        # Returns (labels, distances, gallery indices) of the nearest gallery vector per query
+        queries = np.asarray(queries, dtype=np.float64).reshape(len(queries), -1)
+        if len(queries) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64), np.empty(0, dtype=np.intp)
+
+        nearest = pairwise_distances(queries, self.vectors, self.metric, self.vector_sums).argmin(axis=1)
+        distances = paired_distances(queries, self.vectors[nearest], self.metric)
+        return self.labels[nearest], distances, nearest
+
+    def add(self, vectors, labels):
+        labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        vectors = np.asarray(vectors, dtype=self.vectors.dtype).reshape(len(labels), -1)
+        self.vectors = np.vstack([self.vectors, vectors])
+        self.labels = np.concatenate([self.labels, labels])
+        if self.vector_sums is not None:
+            self.vector_sums = np.concatenate([self.vector_sums, vectors.sum(axis=1, dtype=np.float64)])
+        return vectors
+
+    def to_arrays(self):
+        return {'kind': self.kind, 'metric': self.metric, 'vectors': self.vectors, 'labels': self.labels}
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, **self.to_arrays())
+
+
+# Inverted-file index: a k-means coarse quantizer splits the gallery into `nlist` cells and each
+# query is only compared against the vectors in its `nprobe` closest cells.
+class IVFIndex(ExactIndex):
+    kind = 'ivf'
+
+    def __init__(self, vectors, labels, metric='l2', nlist=None, nprobe=IVF_NPROBE, centroids=None, assignments=None, seed=0):
+        super().__init__(vectors, labels, metric)
+        if centroids is not None:
+            nlist = len(centroids)
+        self.nlist = min(nlist or max(1, int(np.sqrt(len(self)))), len(self))
+        self.nprobe = max(1, min(nprobe, self.nlist))
+        if centroids is None:
+            centroids, assignments = kmeans(self.vectors, self.nlist, seed=seed)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float64)
+        self._build_lists(np.asarray(assignments, dtype=np.intp))
+
+    def _build_lists(self, assignments):
+        self.assignments = assignments
+        self.order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    def add(self, vectors, labels):
+        # New vectors join their nearest existing cell; the coarse quantizer is not retrained
+        vectors = super().add(vectors, labels)
+        new_assignments = pairwise_distances(vectors, self.centroids, 'l2').argmin(axis=1)
+        self._build_lists(np.concatenate([self.assignments, new_assignments]))
+        return vectors
+
+    def search(self, queries, nprobe=None):
+        queries = np.asarray(queries, dtype=np.float64).reshape(len(queries), -1)
+        if len(queries) == 0:
+            return super().search(queries)
+
+        nprobe = max(1, min(nprobe or self.nprobe, len(self.centroids)))
+        coarse = pairwise_distances(queries, self.centroids, 'l2')
+        if nprobe < len(self.centroids):
+            probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(len(self.centroids)), coarse.shape)
+
+        nearest = np.empty(len(queries), dtype=np.intp)
+        for i, query in enumerate(queries):
+            candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probes[i]])
+            if len(candidates) == 0:
+                candidates = np.arange(len(self))
+            cand_sums = self.vector_sums[candidates] if self.vector_sums is not None else None
+            cand_dists = pairwise_distances(query[None, :], self.vectors[candidates], self.metric, cand_sums)[0]
+            nearest[i] = candidates[cand_dists.argmin()]
+        distances = paired_distances(queries, self.vectors[nearest], self.metric)
+        return self.labels[nearest], distances, nearest
+
+    def to_arrays(self):
+        arrays = super().to_arrays()
+        arrays.update({'centroids': self.centroids, 'assignments': self.assignments, 'nprobe': self.nprobe})
+        return arrays
+
+
+def kmeans(vectors, k, iterations=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].astype(np.float64)
+    assignments = np.zeros(len(vectors), dtype=np.intp)
+    for iteration in range(iterations):
+        new_assignments = pairwise_distances(vectors, centroids, 'l2').argmin(axis=1)
+        if iteration > 0 and np.array_equal(new_assignments, assignments):
+            break
+        assignments = new_assignments
+
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=k)
+        occupied = counts > 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[occupied]
+        sums = np.add.reduceat(vectors[order], starts, axis=0)
+        # Empty cells keep their previous centroid
+        centroids[occupied] = sums / counts[occupied, None]
+    return centroids, assignments
+
+
+def build_index(vectors, labels, metric='l2', kind=GALLERY_INDEX):
+    if kind == 'ivf' and len(labels) >= GALLERY_INDEX_MIN_SIZE:
+        return IVFIndex(vectors, labels, metric, nlist=IVF_NLIST)
+    if kind not in ('ivf', 'exact'):
+        raise ValueError(f"Unknown gallery index type: {kind}")
+    return ExactIndex(vectors, labels, metric)
+
+
+def load_index(path):
+    with np.load(path) as data:
+        kind = str(data['kind'])
+        metric = str(data['metric'])
+        if kind == 'ivf':
+            return IVFIndex(data['vectors'], data['labels'], metric, nprobe=int(data['nprobe']),
+                            centroids=data['centroids'], assignments=data['assignments'])
+        return ExactIndex(data['vectors'], data['labels'], metric)
+
+
+def index_path(model_type):
+    return TRAINED_DATA_DIR / f'{model_type}_gallery_index.npz'
+
+
+def load_gallery(model_type, model, model_path, rebuild=True):
+    # The persisted index is used when it is at least as new as the model file; otherwise the
+    # gallery is rebuilt from the model (or None is returned when rebuild is False)
+    path = index_path(model_type)
+    if path.exists() and path.stat().st_mtime >= model_path.stat().st_mtime:
+        return load_index(path)
+    if not rebuild:
+        return None
+    vectors, labels, metric = gallery_from_model(model_type, model)
+    return build_index(vectors, labels, metric)
+
+
+def stack_rows(samples):
+    # OpenCV returns one 1 x N array per sample; the binary store and NumpyLBPH already hold a
+    # 2-D array, which is used as is so a memory-mapped gallery is not copied
+    if isinstance(samples, np.ndarray) and samples.ndim == 2:
+        return samples
+    return np.vstack([np.asarray(sample).reshape(1, -1) for sample in samples])
+
+
+def gallery_from_model(model_type, model):
+    # Returns (vectors, labels, metric) of the stored training samples of an OpenCV face model
+    labels = model.getLabels().reshape(-1)
+    if model_type in ('lbph', 'lbph_numpy'):
+        return stack_rows(model.getHistograms()), labels, 'chisqr'
+    return stack_rows(model.getProjections()), labels, 'l2'
+
+
+def recall_report(index, queries, nprobes=(1, 2, 4, 8, 16)):
+    # Compares top-1 recall and per-query latency of the IVF index against exact search
+    exact = ExactIndex(index.vectors, index.labels, index.metric)
+
+    def timed_search(search):
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            results.append(search(query[None, :])[2][0])
+            latencies.append(time.perf_counter() - start)
+        latencies = np.asarray(latencies) * 1000
+        return np.asarray(results), {'mean_ms': float(latencies.mean()),
+                                     'p50_ms': float(np.percentile(latencies, 50)),
+                                     'p95_ms': float(np.percentile(latencies, 95))}
+
+    truth, exact_stats = timed_search(exact.search)
+    report = {'gallery_size': len(index), 'metric': index.metric, 'queries': len(queries),
+              'exact': {'recall': 1.0, **exact_stats}, 'ivf': []}
+    if isinstance(index, IVFIndex):
+        report['nlist'] = len(index.centroids)
+        for nprobe in nprobes:
+            if nprobe > len(index.centroids):
+                break
+            found, stats = timed_search(lambda q: index.search(q, nprobe=nprobe))
+            report['ivf'].append({'nprobe': nprobe, 'recall': float(np.mean(found == truth)), **stats})
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recall-vs-latency report for the gallery index against exact search.")
+    parser.add_argument('--model', choices=['eigen', 'fisher', 'lbph'], default='eigen')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help="Replicate the trained gallery with noise up to this many vectors")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--noise', type=float, default=0.05, help="Query noise relative to gallery spread")
+    parser.add_argument('--nlist', type=int, default=None)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    import cv2
+    model = {'eigen': cv2.face.EigenFaceRecognizer_create, 'fisher': cv2.face.FisherFaceRecognizer_create,
+             'lbph': cv2.face.LBPHFaceRecognizer_create}[args.model]()
+    model_path = TRAINED_DATA_DIR / f'{args.model}_trained_data.xml'
+    if not model_path.exists():
+        logger.error(f"Model file {model_path} not found. Please train first.")
+        return 1
+    model.read(str(model_path))
+    vectors, labels, metric = gallery_from_model(args.model, model)
+
+    rng = np.random.default_rng(0)
+    spread = vectors.std(axis=0).mean()
+
+    def perturb(samples, scale):
+        noise = rng.normal(0, scale, samples.shape)
+        if metric == 'chisqr':
+            # Histograms stay sparse and non-negative
+            return np.abs(samples + noise * (samples > 0))
+        return samples + noise
+
+    if args.synthetic > len(vectors):
+        picks = rng.integers(0, len(vectors), args.synthetic)
+        vectors, labels = perturb(vectors[picks], spread), np.arange(args.synthetic)
+
+    logger.info(f"Building IVF index over {len(vectors)} {metric} vectors...")
+    index = IVFIndex(vectors, labels, metric, nlist=args.nlist)
+    queries = perturb(vectors[rng.integers(0, len(vectors), args.queries)], args.noise * spread)
+
+    report = recall_report(index, queries)
+    report['model'] = args.model
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+import itertools
+import json
+import os
+import threading
+import time
+import numpy as np
+from config import *
+
+PERCENTILES = (50, 95, 99)
+
+
+# Fixed-size ring of (start, duration, thread id) samples for one span name. Slots are claimed
+# with next() on an itertools.count, which is atomic under the GIL, so threads recording the
+# same span never take a lock; once full, the oldest samples are overwritten.
+class SpanRing:
+    def __init__(self, capacity=INSTRUMENT_BUFFER_SIZE):
+        self.capacity = capacity
+        self.starts = np.zeros(capacity)
+        self.durations = np.zeros(capacity)
+        self.threads = np.zeros(capacity, dtype=np.int64)
+        self.counter = itertools.count()
+        self.count = 0
+
+    def append(self, start, duration, thread_id):
+        index = next(self.counter)
+        slot = index % self.capacity
+        self.starts[slot] = start
+        self.durations[slot] = duration
+        self.threads[slot] = thread_id
+        self.count = max(self.count, index + 1)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def last(self, n=None):
+        # Durations of the n most recent samples (all buffered samples by default)
+        size = len(self)
+        n = size if n is None else min(n, size)
+        end = self.count % self.capacity
+        return self.durations[np.arange(end - n, end) % self.capacity]
+
+    def clear(self):
+        self.counter = itertools.count()
+        self.count = 0
+
+
+class _Span:
+    __slots__ = ('instruments', 'name', 'start')
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        self.instruments.record(self.name, self.start, end - self.start)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+# Timing spans for the hot path (decode, convert, resize, detect, predict, draw, ...). When
+# disabled, span() hands back a shared no-op context manager, so instrumented code costs one
+# attribute check per span.
+class Instrumentation:
+    def __init__(self, enabled=INSTRUMENTATION, capacity=INSTRUMENT_BUFFER_SIZE):
+        self.enabled = enabled
+        self.capacity = capacity
+        self.rings = {}
+        self.thread_names = {}
+        self.origin = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def enable(self, enabled=True):
+        self.enabled = enabled
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else NULL_SPAN
+
+    def ring(self, name):
+        ring = self.rings.get(name)
+        if ring is None:
+            # Only the first sample of a span name takes the lock
+            with self.lock:
+                ring = self.rings.setdefault(name, SpanRing(self.capacity))
+        return ring
+
+    def record(self, name, start, duration):
+        thread_id = threading.get_ident()
+        if thread_id not in self.thread_names:
+            self.thread_names[thread_id] = threading.current_thread().name
+        self.ring(name).append(start - self.origin, duration, thread_id)
+
+    def reset(self):
+        for ring in self.rings.values():
+            ring.clear()
+        self.origin = time.perf_counter()
+
+    def mean_ms(self, name, last=None):
+        ring = self.rings.get(name)
+        if ring is None or len(ring) == 0:
+            return 0.0
+        return float(ring.last(last).mean() * 1000)
+
+    def percentiles(self, name, percentiles=PERCENTILES):
+        ring = self.rings.get(name)
+        if ring is None or len(ring) == 0:
+            return {}
+        values = np.percentile(ring.last() * 1000, percentiles)
+        return {f'p{p}_ms': float(v) for p, v in zip(percentiles, values)}
+
+    def histogram(self, name, bins=20):
+        # (counts, bin edges in ms) over the buffered samples of one span
+        ring = self.rings.get(name)
+        if ring is None or len(ring) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.histogram(ring.last() * 1000, bins=bins)
+
+    def summary(self):
+        stats = {}
+        for name, ring in sorted(self.rings.items()):
+            if len(ring) == 0:
+                continue
+            ms = ring.last() * 1000
+            stats[name] = {'samples': ring.count, 'mean_ms': float(ms.mean()), **self.percentiles(name),
+                           'max_ms': float(ms.max())}
+        return stats
+
+    def trace_events(self):
+        # Chrome trace format ("X" complete events, microseconds), viewable in chrome://tracing or Perfetto
+        pid = os.getpid()
+        events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}}
+                  for tid, name in self.thread_names.items()]
+        for name, ring in self.rings.items():
+            size = len(ring)
+            for start, duration, tid in zip(ring.starts[:size], ring.durations[:size], ring.threads[:size]):
+                events.append({'name': name, 'cat': 'face', 'ph': 'X', 'pid': pid, 'tid': int(tid),
+                               'ts': round(start * 1e6, 1), 'dur': round(duration * 1e6, 1)})
+        return events
+
+    def write_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms',
+                       'otherData': {'summary': self.summary()}}, f)
+        logger.info(f"Trace with {sum(len(r) for r in self.rings.values())} spans written to {path}")
+
+    def finish_run(self, name):
+        # Logs the span summary, dumps a trace for the run and starts over for the next run
+        if not self.enabled or not self.rings:
+            return None
+        for span, stats in self.summary().items():
+            logger.info(f"{span}: {stats['samples']} samples, mean {stats['mean_ms']:.2f} ms, "
+                        f"p95 {stats['p95_ms']:.2f} ms, max {stats['max_ms']:.2f} ms")
+        TRACE_DIR.mkdir(parents=True, exist_ok=True)
+        path = TRACE_DIR / f"{name}_{time.strftime('%Y%m%d_%H%M%S')}.json"
+        self.write_trace(path)
+        self.reset()
+        return path
+
+
+# Process-wide instance shared by every engine
+instruments = Instrumentation()
@@ -0,0 +1,157 @@
+import numpy as np
+from pathlib import Path
+from gallery_index import ExactIndex, stack_rows
+
+# Faces per LBP batch; bounds the float32 temporaries to a few MB per neighbour
+LBP_BATCH_SIZE = 256
+
+
+def lbp_codes(faces, radius=1, neighbors=8):
+    # Extended (circular) LBP codes for a batch of N x H x W uint8 faces, computed exactly like
+    # OpenCV's elbp_: bilinear sampling in float32 and a bit set where sample >= centre (with an
+    # epsilon tolerance). Returns N x (H - 2r) x (W - 2r) int32 codes.
+    src = np.asarray(faces, dtype=np.float32)
+    rows, cols = src.shape[1] - 2 * radius, src.shape[2] - 2 * radius
+    center = src[:, radius:radius + rows, radius:radius + cols]
+    codes = np.zeros((len(src), rows, cols), dtype=np.int32)
+    one, eps = np.float32(1), np.finfo(np.float32).eps
+
+    def shifted(dy, dx):
+        return src[:, radius + dy:radius + dy + rows, radius + dx:radius + dx + cols]
+
+    for n in range(neighbors):
+        x = np.float32(radius * np.cos(2.0 * np.pi * n / float(neighbors)))
+        y = np.float32(-radius * np.sin(2.0 * np.pi * n / float(neighbors)))
+        fx, fy = int(np.floor(x)), int(np.floor(y))
+        cx, cy = int(np.ceil(x)), int(np.ceil(y))
+        ty, tx = y - np.float32(fy), x - np.float32(fx)
+        w1, w2 = (one - tx) * (one - ty), tx * (one - ty)
+        w3, w4 = (one - tx) * ty, tx * ty
+        t = w1 * shifted(fy, fx) + w2 * shifted(fy, cx) + w3 * shifted(cy, fx) + w4 * shifted(cy, cx)
+        codes |= ((t > center) | (np.abs(t - center) < eps)).astype(np.int32) << n
+    return codes
+
+
+def spatial_histograms(codes, num_patterns, grid_x=8, grid_y=8):
+    # Per-cell code histograms normalised by the cell size, concatenated row-major over the grid
+    # (OpenCV's spatial_histogram). One bincount covers every cell of every face in the batch.
+    n, rows, cols = codes.shape
+    height, width = rows // grid_y, cols // grid_x
+    num_cells = grid_x * grid_y
+    cells = (codes[:, :grid_y * height, :grid_x * width]
+             .reshape(n, grid_y, height, grid_x, width)
+             .transpose(0, 1, 3, 2, 4)
+             .reshape(n, num_cells, height * width))
+    offsets = (np.arange(n * num_cells, dtype=np.int64) * num_patterns).reshape(n, num_cells, 1)
+    counts = np.bincount((cells + offsets).ravel(), minlength=n * num_cells * num_patterns)
+    histograms = counts.reshape(n, num_cells * num_patterns).astype(np.float32)
+    histograms /= np.float32(max(1, height * width))
+    return histograms
+
+
+def lbph_features(faces, radius=1, neighbors=8, grid_x=8, grid_y=8):
+    faces = np.asarray(faces)
+    features = np.empty((len(faces), grid_x * grid_y * 2 ** neighbors), dtype=np.float32)
+    for start in range(0, len(faces), LBP_BATCH_SIZE):
+        codes = lbp_codes(faces[start:start + LBP_BATCH_SIZE], radius, neighbors)
+        features[start:start + len(codes)] = spatial_histograms(codes, 2 ** neighbors, grid_x, grid_y)
+    return features
+
+
+# Batched LBPH prediction: histograms for all faces of a frame are computed in one pass and
+# matched against the stacked gallery with the vectorized chi-square of the gallery index.
+# Works on an OpenCV LBPH model, a binary-store model or a NumpyLBPH.
+class LBPHPredictor:
+    def __init__(self, histograms, labels, radius=1, neighbors=8, grid_x=8, grid_y=8, index=None):
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.index = index if index is not None else ExactIndex(histograms, labels, 'chisqr')
+
+    @classmethod
+    def from_model(cls, model, index=None):
+        return cls(stack_rows(model.getHistograms()), model.getLabels(), int(model.getRadius()), int(model.getNeighbors()),
+                   int(model.getGridX()), int(model.getGridY()), index)
+
+    def features(self, faces):
+        return lbph_features(faces, self.radius, self.neighbors, self.grid_x, self.grid_y)
+
+    def predict(self, faces):
+        # Returns (labels, distances) arrays with one entry per face, matching model.predict()
+        if len(faces) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        labels, distances, _ = self.index.search(self.features(faces).astype(np.float64))
+        return labels, distances
+
+
+# Trainable drop-in for cv2.face.LBPHFaceRecognizer (model_type 'lbph_numpy'). It has no XML
+# form: the binary model store directory is its model of record.
+class NumpyLBPH:
+    def __init__(self, radius=1, neighbors=8, grid_x=8, grid_y=8, threshold=np.finfo(np.float64).max):
+        self.radius = radius
+        self.neighbors = neighbors
+        self.grid_x = grid_x
+        self.grid_y = grid_y
+        self.threshold = threshold
+        self.histograms = np.empty((0, grid_x * grid_y * 2 ** neighbors), dtype=np.float32)
+        self.labels = np.empty(0, dtype=np.int32)
+        self._predictor = None
+
+    def features(self, images):
+        return lbph_features(np.asarray(images), self.radius, self.neighbors, self.grid_x, self.grid_y)
+
+    def train(self, images, labels):
+        self.histograms = self.features(images)
+        self.labels = np.asarray(labels, dtype=np.int32).reshape(-1)
+        self._predictor = None
+
+    def update(self, images, labels):
+        self.histograms = np.vstack([self.histograms, self.features(images)])
+        self.labels = np.concatenate([self.labels, np.asarray(labels, dtype=np.int32).reshape(-1)])
+        self._predictor = None
+
+    def predict(self, face):
+        if self._predictor is None:
+            self._predictor = LBPHPredictor.from_model(self)
+        labels, distances = self._predictor.predict(np.asarray(face)[None])
+        label, distance = int(labels[0]), float(distances[0])
+        # Same rule as OpenCV: no label when the nearest sample is beyond the model threshold
+        return (label if distance < self.threshold else -1), distance
+
+    def save(self, path):
+        # `path` is the meta.json of the binary store directory (see model_store.model_path)
+        from model_store import save_binary_model
+        save_binary_model('lbph_numpy', self, Path(path).parent)
+
+    def read(self, path):
+        from model_store import load_binary_model
+        model = load_binary_model('lbph_numpy', Path(path).parent, mmap=False)
+        self.radius, self.neighbors = model.getRadius(), model.getNeighbors()
+        self.grid_x, self.grid_y = model.getGridX(), model.getGridY()
+        self.threshold = model.getThreshold()
+        self.histograms = np.asarray(model.getHistograms(), dtype=np.float32)
+        self.labels = np.asarray(model.getLabels(), dtype=np.int32)
+        self._predictor = None
+
+    def getHistograms(self):
+        return self.histograms
+
+    def getLabels(self):
+        return self.labels
+
+    def getThreshold(self):
+        return self.threshold
+
+    def getRadius(self):
+        return self.radius
+
+    def getNeighbors(self):
+        return self.neighbors
+
+    def getGridX(self):
+        return self.grid_x
+
+    def getGridY(self):
+        return self.grid_y
@@ -0,0 +1,393 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import struct
+import sys
+import time
+import numpy as np
+from multiprocessing import resource_tracker, shared_memory
+from config import *
+from gallery_index import ExactIndex, IVFIndex, load_gallery
+from lbph_numpy import LBPHPredictor
+from model_store import MODEL_FACTORIES, binary_model_is_current, binary_model_path, load_binary_model, xml_model_path
+from subspace_predictor import SubspacePredictor
+from training_logic import ModelWatcher, load_versioned_label_map
+
+MODEL_TYPES = ('lbph', 'lbph_numpy', 'eigen', 'fisher')
+# Control segment header: sequence number (odd while the descriptor is being rewritten) and descriptor length
+HEADER = struct.Struct('qq')
+SEQUENCE = struct.Struct('q')
+# Followed by the host's pid and heartbeat (time.monotonic(), a system-wide clock), then the descriptor
+LIVENESS = struct.Struct('qd')
+DESCRIPTOR_OFFSET = HEADER.size + LIVENESS.size
+ALIGNMENT = 64
+
+
+def control_name(model_type, prefix=MODEL_HOST_PREFIX):
+    return f"{prefix}_{model_type}"
+
+
+def open_segment(name, create=False, size=0):
+    # Segments must outlive the processes that attach them: the host unlinks its segments
+    # explicitly and workers never do. Left tracked, the resource tracker would unlink a segment
+    # as soon as any process that merely attached it exits.
+    try:
+        return shared_memory.SharedMemory(name, create, size, track=False)
+    except TypeError:
+        # Python < 3.13 has no track argument
+        segment = shared_memory.SharedMemory(name, create, size)
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        return segment
+
+
+def unlink_segment(segment):
+    # unlink() also unregisters the name from the resource tracker; on Python < 3.13 open_segment()
+    # already did that, so it is registered again first to keep the tracker consistent
+    segment.close()
+    if getattr(segment, '_track', True):
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.unlink()
+
+
+def read_descriptor(control, retries=1000):
+    # Seqlock read: retried while the host is rewriting the descriptor. Returns (version, descriptor)
+    # or (0, None) when nothing has been published yet.
+    for _ in range(retries):
+        sequence, length = HEADER.unpack_from(control.buf)
+        if sequence == 0:
+            return 0, None
+        if sequence % 2 == 0:
+            data = bytes(control.buf[DESCRIPTOR_OFFSET:DESCRIPTOR_OFFSET + length])
+            if SEQUENCE.unpack_from(control.buf)[0] == sequence:
+                return sequence // 2, json.loads(data)
+        time.sleep(0.001)
+    raise TimeoutError(f"Descriptor of {control.name} kept changing")
+
+
+def load_trained_model(model_type):
+    # The model of record FaceRecognizer would load: the binary store when it is current, else the XML.
+    # Returns (model, path of the loaded file).
+    if model_type == 'lbph_numpy' or (MODEL_FORMAT == 'binary' and binary_model_is_current(model_type)):
+        return load_binary_model(model_type), binary_model_path(model_type) / 'meta.json'
+    path = xml_model_path(model_type)
+    if not path.exists():
+        raise FileNotFoundError(f"Model file {path} not found. Please train first.")
+    model = MODEL_FACTORIES[model_type]()
+    model.read(str(path))
+    return model, path
+
+
+def shared_arrays(model_type):
+    # Flat arrays a worker needs to predict, plus JSON metadata. The gallery is stored the way the
+    # index and predictors use it (float64 projections or float32 LBP histograms, int32 labels), so
+    # workers never copy it.
+    model, path = load_trained_model(model_type)
+    index = load_gallery(model_type, model, path)
+    arrays = {'gallery_vectors': index.vectors, 'gallery_labels': index.labels}
+    meta = {'index': {'kind': index.kind, 'metric': index.metric}}
+    if index.kind == 'ivf':
+        arrays.update({'centroids': index.centroids, 'assignments': index.assignments})
+        meta['index']['nprobe'] = int(index.nprobe)
+    if model_type in ('lbph', 'lbph_numpy'):
+        meta['lbph'] = {'radius': int(model.getRadius()), 'neighbors': int(model.getNeighbors()),
+                        'grid_x': int(model.getGridX()), 'grid_y': int(model.getGridY())}
+    else:
+        arrays['eigenvectors'] = np.asarray(model.getEigenVectors(), dtype=np.float64)
+        arrays['mean'] = np.asarray(model.getMean(), dtype=np.float64).reshape(1, -1)
+    label_map, meta['label_version'] = load_versioned_label_map(model_type)
+    if label_map is None:
+        raise FileNotFoundError(f"No label map for {model_type}. Please train again.")
+    meta['label_map'] = {str(k): v for k, v in label_map.items()}
+    return arrays, meta
+
+
+def build_predictor(model_type, arrays, meta):
+    # Predictors over arrays that live in shared memory; nothing here copies the gallery or subspace
+    options = meta['index']
+    if options['kind'] == 'ivf':
+        index = IVFIndex(arrays['gallery_vectors'], arrays['gallery_labels'], options['metric'], nprobe=options['nprobe'],
+                         centroids=arrays['centroids'], assignments=arrays['assignments'])
+    else:
+        index = ExactIndex(arrays['gallery_vectors'], arrays['gallery_labels'], options['metric'])
+    if model_type in ('lbph', 'lbph_numpy'):
+        return LBPHPredictor(None, None, index=index, **meta['lbph'])
+    return SubspacePredictor(arrays['eigenvectors'], arrays['mean'], None, None, index)
+
+
+# Loads each trained model once and publishes it in shared memory. Every publication goes into a
+# new segment ({prefix}_{model}_v{version}); a small control segment ({prefix}_{model}) holds the
+# JSON descriptor of the current one (segment name, array offsets/shapes/dtypes, label map) behind
+# a seqlock, so workers can poll the version with one 16-byte read. The host also stamps a
+# heartbeat there, so workers notice a host that was killed without removing its segments.
+class ModelHost:
+    def __init__(self, model_types=MODEL_TYPES, prefix=MODEL_HOST_PREFIX, control_size=MODEL_HOST_CONTROL_SIZE):
+        self.model_types = list(model_types)
+        self.prefix = prefix
+        self.control_size = control_size
+        self.controls = {}
+        self.segments = {}
+        self.versions = {}
+        self.watchers = {}
+
+    def start(self):
+        for model_type in self.model_types:
+            self.remove_stale(model_type)
+            self.controls[model_type] = open_segment(control_name(model_type, self.prefix), True, self.control_size)
+            self.versions[model_type] = 0
+            self.watchers[model_type] = ModelWatcher(model_type)
+            self.beat()
+            self.publish(model_type)
+        return self
+
+    def beat(self):
+        for control in self.controls.values():
+            LIVENESS.pack_into(control.buf, HEADER.size, os.getpid(), time.monotonic())
+
+    def remove_stale(self, model_type):
+        # Segments left behind by a host that did not shut down cleanly
+        try:
+            control = open_segment(control_name(model_type, self.prefix))
+        except FileNotFoundError:
+            return
+        try:
+            _, descriptor = read_descriptor(control, retries=1)
+            if descriptor is not None:
+                unlink_segment(open_segment(descriptor['segment']))
+        except (FileNotFoundError, TimeoutError, ValueError):
+            pass
+        unlink_segment(control)
+        logger.warning(f"Removed stale shared model segments for {model_type}")
+
+    def publish(self, model_type):
+        try:
+            arrays, meta = shared_arrays(model_type)
+        except Exception as e:
+            logger.error(f"Could not load {model_type} for sharing: {e}")
+            return False
+
+        version = self.versions[model_type] + 1
+        layout, size = {}, 0
+        for name, array in arrays.items():
+            layout[name] = {'offset': size, 'shape': list(array.shape), 'dtype': array.dtype.str}
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        segment = open_segment(f"{control_name(model_type, self.prefix)}_v{version}", True, max(size, 1))
+        for name, array in arrays.items():
+            spec = layout[name]
+            np.ndarray(array.shape, array.dtype, buffer=segment.buf, offset=spec['offset'])[...] = array
+
+        descriptor = json.dumps({'segment': segment.name, 'arrays': layout, 'meta': meta}).encode()
+        self.write_descriptor(model_type, descriptor)
+        old = self.segments.get(model_type)
+        self.segments[model_type] = segment
+        self.versions[model_type] = version
+        # Workers still mapping the old segment keep it until they switch; unlinking only removes the name
+        if old is not None:
+            unlink_segment(old)
+        logger.info(f"Published {model_type} v{version}: {len(arrays['gallery_labels'])} gallery samples, "
+                    f"{size / 2 ** 20:.1f} MB in {segment.name}")
+        return True
+
+    def write_descriptor(self, model_type, descriptor):
+        control = self.controls[model_type]
+        if DESCRIPTOR_OFFSET + len(descriptor) > control.size:
+            raise ValueError(f"Descriptor of {len(descriptor)} bytes does not fit MODEL_HOST_CONTROL_SIZE")
+        sequence = SEQUENCE.unpack_from(control.buf)[0]
+        SEQUENCE.pack_into(control.buf, 0, sequence + 1)
+        control.buf[DESCRIPTOR_OFFSET:DESCRIPTOR_OFFSET + len(descriptor)] = descriptor
+        HEADER.pack_into(control.buf, 0, sequence + 1, len(descriptor))
+        SEQUENCE.pack_into(control.buf, 0, sequence + 2)
+
+    def poll(self):
+        # Republishes retrained models; a failed load is not retried until the files change again
+        for model_type, watcher in self.watchers.items():
+            if watcher.poll() is not None:
+                self.publish(model_type)
+                self.beat()
+
+    def serve(self, interval=MODEL_HOST_POLL_INTERVAL):
+        logger.info(f"Serving {', '.join(self.model_types)}; press Ctrl-C to stop.")
+        try:
+            while True:
+                time.sleep(interval)
+                self.beat()
+                self.poll()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        for segment in list(self.segments.values()) + list(self.controls.values()):
+            unlink_segment(segment)
+        self.segments.clear()
+        self.controls.clear()
+
+
+# Worker side: attaches to the current publication of one model type without copying it
+class SharedModelClient:
+    def __init__(self, model_type, prefix=MODEL_HOST_PREFIX):
+        self.model_type = model_type
+        self.control = open_segment(control_name(model_type, prefix))
+        self.segment = None
+        self.version = 0
+        self.label_version = None
+        # Segments whose arrays may still be referenced by a previous predictor
+        self.retired = []
+
+    def published_version(self):
+        return SEQUENCE.unpack_from(self.control.buf)[0] // 2
+
+    def changed(self):
+        return self.published_version() != self.version
+
+    def host_pid(self):
+        return LIVENESS.unpack_from(self.control.buf, HEADER.size)[0]
+
+    def alive(self, timeout=MODEL_HOST_HEARTBEAT_TIMEOUT):
+        # False once the host has stopped stamping its heartbeat, e.g. after a SIGKILL or a crash
+        heartbeat = LIVENESS.unpack_from(self.control.buf, HEADER.size)[1]
+        return time.monotonic() - heartbeat < timeout
+
+    def attach(self):
+        # Returns (predictor, label_map) for the newest publication
+        if not self.alive():
+            raise FileNotFoundError(f"The {self.model_type} model host (pid {self.host_pid()}) is no longer running")
+        for _ in range(10):
+            version, descriptor = read_descriptor(self.control)
+            if descriptor is None:
+                raise FileNotFoundError(f"No {self.model_type} model has been published yet")
+            try:
+                segment = open_segment(descriptor['segment'])
+                break
+            except FileNotFoundError:
+                # Replaced between reading the descriptor and attaching
+                continue
+        else:
+            raise FileNotFoundError(f"Could not attach to a published {self.model_type} model")
+
+        arrays = {}
+        for name, spec in descriptor['arrays'].items():
+            array = np.ndarray(tuple(spec['shape']), np.dtype(spec['dtype']), buffer=segment.buf, offset=spec['offset'])
+            array.flags.writeable = False
+            arrays[name] = array
+        meta = descriptor['meta']
+        predictor = build_predictor(self.model_type, arrays, meta)
+
+        if self.segment is not None:
+            self.retired.append(self.segment)
+        self.segment = segment
+        self.version = version
+        self.label_version = meta.get('label_version')
+        self.release_retired()
+        return predictor, {int(k): v for k, v in meta['label_map'].items()}
+
+    def release_retired(self):
+        # A segment can only be unmapped once no array views into it are left
+        for segment in list(self.retired):
+            try:
+                segment.close()
+                self.retired.remove(segment)
+            except BufferError:
+                pass
+
+    def close(self):
+        # Segments still referenced by a predictor stay in `retired` until it is replaced
+        if self.segment is not None:
+            self.retired.append(self.segment)
+            self.segment = None
+        self.release_retired()
+        self.control.close()
+
+
+def private_memory_kb():
+    # Memory only this process uses (Linux), the per-camera cost of a recognizer process
+    try:
+        with open('/proc/self/smaps_rollup') as f:
+            fields = dict(line.split(':', 1) for line in f if line.startswith('Private'))
+    except OSError:
+        return None
+    return sum(int(value.split()[0]) for value in fields.values())
+
+
+def _benchmark_worker(model_type, shared, faces, results, done):
+    from recog_logic import FaceRecognizer
+    before = private_memory_kb()
+    start = time.perf_counter()
+    recognizer = FaceRecognizer(model_type, host=shared)
+    loaded = time.perf_counter() - start
+    recognizer.predict_faces(list(faces))
+    results.put({'shared': recognizer.host is not None, 'private_kb': private_memory_kb() - before,
+                 'load_ms': loaded * 1000})
+    # Stays alive until every worker has measured, like concurrent camera processes
+    done.wait()
+
+
+def benchmark(model_types=('eigen', 'lbph'), workers=4):
+    # Private memory and load time of `workers` concurrent recognizer processes, each loading its
+    # own copy of the model vs attaching to a host
+    context = multiprocessing.get_context('spawn')
+    faces = np.random.default_rng(0).integers(0, 256, (4, FACE_HEIGHT, FACE_WIDTH), dtype=np.uint8)
+    host = ModelHost(model_types).start()
+    report = {}
+    try:
+        for model_type in model_types:
+            report[model_type] = {}
+            for shared in (False, True):
+                # The host is not serving here, so its heartbeat is stamped before each round
+                host.beat()
+                results, done = context.Queue(), context.Event()
+                processes = [context.Process(target=_benchmark_worker, args=(model_type, shared, faces, results, done))
+                             for _ in range(workers)]
+                for process in processes:
+                    process.start()
+                samples = [results.get() for _ in processes]
+                done.set()
+                for process in processes:
+                    process.join()
+                mode = 'shared' if shared else 'private'
+                if shared and not all(s['shared'] for s in samples):
+                    logger.warning(f"Some {model_type} workers did not attach to the host")
+                report[model_type][mode] = {
+                    'workers': workers,
+                    'private_mb_per_worker': float(np.mean([s['private_kb'] for s in samples]) / 1024),
+                    'load_ms': float(np.median([s['load_ms'] for s in samples])),
+                }
+            segment = host.segments.get(model_type)
+            report[model_type]['shared_segment_mb'] = segment.size / 2 ** 20 if segment else None
+            logger.info(f"{model_type}: {report[model_type]}")
+    finally:
+        host.close()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve trained models from shared memory to recognizer processes.")
+    parser.add_argument('command', choices=['serve', 'benchmark'])
+    parser.add_argument('--models', nargs='+', choices=MODEL_TYPES, default=['lbph', 'eigen', 'fisher'])
+    parser.add_argument('--workers', type=int, default=4, help="Recognizer processes per mode (benchmark)")
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        # Unlink the segments on `kill` as well as on Ctrl-C
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        host = ModelHost(args.models).start()
+        if not host.segments:
+            host.close()
+            return 1
+        host.serve()
+        return 0
+
+    report = benchmark(args.models, args.workers)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
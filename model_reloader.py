@@ -0,0 +1,80 @@
+import threading
+import time
+import numpy as np
+from collections import deque
+from config import *
+from training_logic import ModelWatcher
+
+
+# Hot reload for a FaceRecognizer. The model files are checked every `interval` seconds from the
+# frame loop (a few stat calls); once a retrain has settled, the new model, predictor, label map
+# and thresholds are loaded on a background thread while frames keep being processed with the old
+# model. The finished state is swapped in at the start of the next frame, so no frame waits for
+# the load and no frame sees half of each model.
+class ModelReloader:
+    def __init__(self, recognizer, interval=HOT_RELOAD_INTERVAL):
+        self.recognizer = recognizer
+        self.interval = interval
+        self.watcher = ModelWatcher(recognizer.model_type)
+        self.next_check = time.monotonic() + interval
+        self.thread = None
+        # State loaded by the background thread, waiting to be swapped in
+        self.ready = None
+        self.swaps = 0
+        self.failures = 0
+        self.swap_times = deque(maxlen=BENCHMARK_WINDOW)
+        self.load_times = deque(maxlen=BENCHMARK_WINDOW)
+
+    def loading(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def poll(self):
+        if self.ready is not None:
+            self.swap()
+        now = time.monotonic()
+        if now < self.next_check or self.loading():
+            return
+        self.next_check = now + self.interval
+        if self.watcher.poll() is not None:
+            self.reload()
+
+    def reload(self):
+        # Starts loading the model files as they are now; ignored while a load is in flight
+        if self.loading():
+            return False
+        self.thread = threading.Thread(target=self.load, name=f"model-reload-{self.recognizer.model_type}", daemon=True)
+        self.thread.start()
+        return True
+
+    def load(self):
+        start = time.perf_counter()
+        state = self.recognizer.load_state()
+        if state is None:
+            # Keeps the current model; the next change to the files triggers another attempt
+            self.failures += 1
+            logger.warning(f"Reloading the {self.recognizer.model_type} model failed; keeping the current one.")
+            return
+        self.load_times.append(time.perf_counter() - start)
+        self.ready = state
+
+    def swap(self):
+        start = time.perf_counter()
+        state, self.ready = self.ready, None
+        self.recognizer.apply_state(state)
+        self.recognizer.is_loaded = True
+        self.swap_times.append(time.perf_counter() - start)
+        self.swaps += 1
+        logger.info(f"Swapped in the retrained {self.recognizer.model_type} model (label map v{state['label_version']}) "
+                    f"after a {self.load_times[-1] * 1000:.0f} ms background load; "
+                    f"the frame loop paused {self.swap_times[-1] * 1e6:.0f} us.")
+
+    def stats(self):
+        swaps = np.asarray(self.swap_times) * 1000
+        loads = np.asarray(self.load_times) * 1000
+        return {
+            'swaps': self.swaps,
+            'failures': self.failures,
+            'mean_swap_ms': float(swaps.mean()) if len(swaps) else None,
+            'max_swap_ms': float(swaps.max()) if len(swaps) else None,
+            'mean_load_ms': float(loads.mean()) if len(loads) else None,
+        }
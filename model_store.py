@@ -0,0 +1,233 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import cv2
+import numpy as np
+from pathlib import Path
+from config import *
+
+MODEL_FACTORIES = {
+    'eigen': cv2.face.EigenFaceRecognizer_create,
+    'fisher': cv2.face.FisherFaceRecognizer_create,
+    'lbph': cv2.face.LBPHFaceRecognizer_create,
+}
+
+
+def xml_model_path(model_type):
+    return TRAINED_DATA_DIR / f'{model_type}_trained_data.xml'
+
+
+def binary_model_path(model_type):
+    return TRAINED_DATA_DIR / f'{model_type}_model'
+
+
+def model_path(model_type):
+    # The file trainers write and recognizers check for. The NumPy LBPH engine has no XML form;
+    # its binary store is the model of record.
+    if model_type == 'lbph_numpy':
+        return binary_model_path(model_type) / 'meta.json'
+    return xml_model_path(model_type)
+
+
+# Read-only view of a model saved in the binary store. Arrays are memory-mapped .npy files and
+# the getters mirror the OpenCV face recognizer API, so code written against a trained cv2 model
+# (SubspacePredictor.from_model, gallery_from_model) works on either.
+class BinaryModel:
+    def __init__(self, model_type, arrays, meta):
+        self.model_type = model_type
+        self.arrays = arrays
+        self.meta = meta
+        self._predictor = None
+
+    def predict(self, face):
+        # Single-face prediction for code written against the cv2 API
+        if self._predictor is None:
+            if self.model_type in ('lbph', 'lbph_numpy'):
+                from lbph_numpy import LBPHPredictor
+                self._predictor = LBPHPredictor.from_model(self)
+            else:
+                from subspace_predictor import SubspacePredictor
+                self._predictor = SubspacePredictor.from_model(self)
+        labels, distances = self._predictor.predict(np.asarray(face)[None])
+        return int(labels[0]), float(distances[0])
+
+    def getLabels(self):
+        return self.arrays['labels']
+
+    def getThreshold(self):
+        return self.meta['threshold']
+
+    def getEigenVectors(self):
+        return self.arrays['eigenvectors']
+
+    def getEigenValues(self):
+        return self.arrays['eigenvalues']
+
+    def getMean(self):
+        return self.arrays['mean']
+
+    def getProjections(self):
+        return self.arrays['projections']
+
+    def getHistograms(self):
+        return self.arrays['histograms']
+
+    def getRadius(self):
+        return self.meta['radius']
+
+    def getNeighbors(self):
+        return self.meta['neighbors']
+
+    def getGridX(self):
+        return self.meta['grid_x']
+
+    def getGridY(self):
+        return self.meta['grid_y']
+
+
+def model_arrays(model_type, model):
+    # Extracts the trained state of an OpenCV (or binary) face model as flat NumPy arrays
+    arrays = {'labels': np.asarray(model.getLabels(), dtype=np.int32).reshape(-1)}
+    meta = {'model_type': model_type, 'threshold': float(model.getThreshold())}
+    if model_type in ('lbph', 'lbph_numpy'):
+        arrays['histograms'] = np.vstack([np.asarray(h, dtype=np.float32).reshape(1, -1) for h in model.getHistograms()])
+        meta.update({'radius': int(model.getRadius()), 'neighbors': int(model.getNeighbors()),
+                     'grid_x': int(model.getGridX()), 'grid_y': int(model.getGridY())})
+    else:
+        arrays['eigenvectors'] = np.asarray(model.getEigenVectors(), dtype=np.float64)
+        arrays['eigenvalues'] = np.asarray(model.getEigenValues(), dtype=np.float64).reshape(-1)
+        arrays['mean'] = np.asarray(model.getMean(), dtype=np.float64).reshape(1, -1)
+        arrays['projections'] = np.vstack([np.asarray(p, dtype=np.float64).reshape(1, -1) for p in model.getProjections()])
+    return arrays, meta
+
+
+def save_binary_model(model_type, model, path=None):
+    # Writes into a temporary directory and swaps it in, so readers never see a partial model
+    path = Path(path or binary_model_path(model_type))
+    arrays, meta = model_arrays(model_type, model)
+    tmp_path = path.with_name(path.name + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    for name, array in arrays.items():
+        np.save(tmp_path / f'{name}.npy', np.ascontiguousarray(array))
+    meta['arrays'] = sorted(arrays)
+    with open(tmp_path / 'meta.json', 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    old_path = path.with_name(path.name + '.old')
+    shutil.rmtree(old_path, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+
+def load_binary_model(model_type, path=None, mmap=True):
+    path = Path(path or binary_model_path(model_type))
+    with open(path / 'meta.json') as f:
+        meta = json.load(f)
+    if meta['model_type'] != model_type:
+        raise ValueError(f"{path} holds a {meta['model_type']} model, not {model_type}")
+    arrays = {name: np.load(path / f'{name}.npy', mmap_mode='r' if mmap else None) for name in meta['arrays']}
+    return BinaryModel(model_type, arrays, meta)
+
+
+def binary_model_is_current(model_type):
+    # The binary store is only used when it is at least as new as the XML it mirrors
+    meta_path = binary_model_path(model_type) / 'meta.json'
+    xml_path = xml_model_path(model_type)
+    if not meta_path.exists():
+        return False
+    return not xml_path.exists() or meta_path.stat().st_mtime >= xml_path.stat().st_mtime
+
+
+def benchmark_startup(model_types=('lbph', 'eigen', 'fisher'), repeats=5):
+    # Median time until a model is ready to predict: XML parse into an OpenCV recognizer vs
+    # memory-mapped binary load plus the NumPy predictor that serves from it, for every type
+    from lbph_numpy import LBPHPredictor
+    from subspace_predictor import SubspacePredictor
+    report = {}
+    for model_type in model_types:
+        xml_path = xml_model_path(model_type)
+        if not xml_path.exists():
+            logger.warning(f"Skipping {model_type}: {xml_path} not found.")
+            continue
+        if not binary_model_is_current(model_type):
+            model = MODEL_FACTORIES[model_type]()
+            model.read(str(xml_path))
+            save_binary_model(model_type, model)
+
+        def load_xml():
+            model = MODEL_FACTORIES[model_type]()
+            model.read(str(xml_path))
+            return model
+
+        def load_binary():
+            # Ends at the NumPy predictor recognizers serve from; it searches the mapped arrays in
+            # place (LBP histograms stay float32), so nothing is copied into memory here
+            model = load_binary_model(model_type)
+            predictor_class = LBPHPredictor if model_type == 'lbph' else SubspacePredictor
+            return predictor_class.from_model(model)
+
+        timings, ready = {}, {}
+        for name, loader in (('xml', load_xml), ('binary', load_binary)):
+            samples = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                predictor = loader()
+                samples.append(time.perf_counter() - start)
+            timings[name] = float(np.median(samples) * 1000)
+            ready[name] = type(predictor).__name__
+
+        binary_dir = binary_model_path(model_type)
+        report[model_type] = {
+            'xml_load_ms': timings['xml'],
+            'binary_load_ms': timings['binary'],
+            'speedup': timings['xml'] / timings['binary'] if timings['binary'] > 0 else None,
+            'xml_ready': ready['xml'],
+            'binary_ready': ready['binary'],
+            'xml_mb': xml_path.stat().st_size / 1e6,
+            'binary_mb': sum(p.stat().st_size for p in binary_dir.iterdir()) / 1e6,
+        }
+        logger.info(f"{model_type}: XML {timings['xml']:.1f} ms ({ready['xml']}), "
+                    f"binary {timings['binary']:.1f} ms ({ready['binary']})")
+    return report
+
+
+def convert_all(model_types=('lbph', 'eigen', 'fisher')):
+    for model_type in model_types:
+        xml_path = xml_model_path(model_type)
+        if not xml_path.exists():
+            continue
+        model = MODEL_FACTORIES[model_type]()
+        model.read(str(xml_path))
+        logger.info(f"Wrote {save_binary_model(model_type, model)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary (memory-mapped .npy) model store tools.")
+    parser.add_argument('command', choices=['convert', 'benchmark'])
+    parser.add_argument('--models', nargs='+', choices=list(MODEL_FACTORIES), default=list(MODEL_FACTORIES))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--json', dest='json_path')
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        convert_all(args.models)
+        return 0
+
+    report = benchmark_startup(args.models, args.repeats)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import argparse
+import json
+import os
+import sys
+import numpy as np
+from pathlib import Path
+from config import *
+
+
+# Packed on-disk face dataset: every face is a fixed-size FACE_HEIGHT x FACE_WIDTH uint8 record in
+# one raw blob, with a parallel int32 label blob and a JSON name table (label id = list index).
+# Records are only ever appended, so readers can memory-map the blobs zero-copy.
+class PackedDataset:
+    def __init__(self, root=PACKED_DATA_DIR):
+        self.root = Path(root)
+        self.faces_path = self.root / 'faces.u8'
+        self.labels_path = self.root / 'labels.i32'
+        self.names_path = self.root / 'names.json'
+        self.record_size = FACE_HEIGHT * FACE_WIDTH
+
+    def exists(self):
+        return self.names_path.exists() and self.faces_path.exists() and self.labels_path.exists()
+
+    def names(self):
+        if not self.names_path.exists():
+            return []
+        with open(self.names_path) as f:
+            return json.load(f)
+
+    def __len__(self):
+        if not self.exists():
+            return 0
+        # A torn append (faces written, labels not yet) is ignored by counting whole records of both
+        return min(self.faces_path.stat().st_size // self.record_size, self.labels_path.stat().st_size // 4)
+
+    def load(self):
+        # Returns (images, labels, label_map) backed by read-only memory maps
+        count = len(self)
+        if count == 0:
+            logger.error(f"Packed dataset at {self.root} is empty.")
+            return None, None, None
+        images = np.memmap(self.faces_path, dtype=np.uint8, mode='r', shape=(count, FACE_HEIGHT, FACE_WIDTH))
+        labels = np.memmap(self.labels_path, dtype=np.int32, mode='r', shape=(count,))
+        label_map = dict(enumerate(self.names()))
+        logger.info(f"Mapped {count} packed faces for {len(label_map)} people from {self.root}")
+        return images, labels, label_map
+
+    def faces_of(self, person_name):
+        # The faces saved for one person (an empty array for a new person)
+        names = self.names()
+        if person_name not in names or len(self) == 0:
+            return np.empty((0, FACE_HEIGHT, FACE_WIDTH), dtype=np.uint8)
+        images, labels, _ = self.load()
+        return images[labels == names.index(person_name)]
+
+    def label_for(self, person_name, names):
+        if person_name not in names:
+            names.append(person_name)
+        return names.index(person_name)
+
+    def append(self, person_name, faces):
+        faces = np.ascontiguousarray(faces, dtype=np.uint8).reshape(-1, FACE_HEIGHT, FACE_WIDTH)
+        if len(faces) == 0:
+            return 0
+        self.root.mkdir(parents=True, exist_ok=True)
+        names = self.names()
+        label_id = self.label_for(person_name, names)
+
+        # The name table is replaced atomically before records that reference it are appended
+        tmp_path = self.names_path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(names, f, indent=2)
+        os.replace(tmp_path, self.names_path)
+
+        # Drop any torn tail so faces and labels stay aligned
+        count = len(self)
+        with open(self.faces_path, 'ab') as f:
+            f.truncate(count * self.record_size)
+            f.write(faces.tobytes())
+        with open(self.labels_path, 'ab') as f:
+            f.truncate(count * 4)
+            f.write(np.full(len(faces), label_id, dtype=np.int32).tobytes())
+        return len(faces)
+
+    def reset(self):
+        for path in (self.faces_path, self.labels_path, self.names_path):
+            path.unlink(missing_ok=True)
+
+
+def convert(face_data_dir=FACE_DATA_DIR, root=PACKED_DATA_DIR):
+    # Rebuilds the packed dataset from the per-person PNG directories
+    from training_logic import load_dataset
+    images, labels, label_map = load_dataset(face_data_dir)
+    if images is None:
+        return False
+    packed = PackedDataset(root)
+    packed.reset()
+    for label_id, name in label_map.items():
+        packed.append(name, images[labels == label_id])
+    logger.info(f"Packed {len(packed)} faces for {len(label_map)} people into {packed.root}")
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Packed, memory-mapped face dataset tools.")
+    parser.add_argument('command', choices=['convert', 'info'])
+    parser.add_argument('--source', type=Path, default=FACE_DATA_DIR, help="Per-person PNG directories to convert")
+    parser.add_argument('--root', type=Path, default=PACKED_DATA_DIR)
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        return 0 if convert(args.source, args.root) else 1
+
+    packed = PackedDataset(args.root)
+    names = packed.names()
+    if len(packed) == 0:
+        print(f"No packed dataset at {packed.root}")
+        return 1
+    _, labels, _ = packed.load()
+    counts = np.bincount(labels, minlength=len(names))
+    for label_id, name in enumerate(names):
+        print(f"{label_id:4d}  {name}: {counts[label_id]} faces")
+    print(f"{len(packed)} faces, {packed.faces_path.stat().st_size / 1e6:.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
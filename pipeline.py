@@ -0,0 +1,153 @@
+import cv2
+import threading
+import time
+from collections import deque
+from config import *
+
+_STOP = object()
+
+
+# Bounded queue with a latest-frame-wins policy: putting into a full queue evicts the oldest
+# item instead of blocking, so a slow consumer never makes its producer fall behind real time.
+class LatestQueue:
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE):
+        self.items = deque()
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        with self.cond:
+            if item is not _STOP and len(self.items) >= self.maxsize:
+                self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.items, timeout):
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class FramePacket:
+    def __init__(self, frame):
+        self.frame = frame
+        self.captured_at = time.perf_counter()
+        self.display_frame = None
+        self.gray = None
+        self.small_gray = None
+        self.faces = ()
+        self.results = []
+
+    def set_preprocessed(self, preprocessed):
+        self.display_frame, self.gray, self.small_gray = preprocessed
+
+
+class PipelineStage(threading.Thread):
+    def __init__(self, name, func, in_queue, out_queue):
+        super().__init__(name=f"pipeline-{name}", daemon=True)
+        self.stage_name = name
+        self.func = func
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.latencies = deque(maxlen=BENCHMARK_WINDOW)
+        self.processed = 0
+
+    def run(self):
+        while True:
+            packet = self.in_queue.get()
+            if packet is _STOP:
+                self.out_queue.put(_STOP)
+                return
+            start = time.perf_counter()
+            try:
+                self.func(packet)
+            except Exception as e:
+                logger.error(f"Pipeline stage {self.stage_name} failed: {e}")
+                continue
+            self.latencies.append(time.perf_counter() - start)
+            self.processed += 1
+            self.out_queue.put(packet)
+
+
+# Capture -> stage 1 -> ... -> stage N, each on its own thread with a LatestQueue in between.
+# Stages mutate the FramePacket in place; the caller consumes finished packets from outputs()
+# on its own thread (the one that owns the GUI window).
+class FramePipeline:
+    def __init__(self, frames, stages, queue_size=PIPELINE_QUEUE_SIZE):
+        self.frames = frames
+        self.queues = [LatestQueue(queue_size) for _ in range(len(stages) + 1)]
+        self.stages = [PipelineStage(name, func, self.queues[i], self.queues[i + 1])
+                       for i, (name, func) in enumerate(stages)]
+        self.stop_event = threading.Event()
+        self.capture_thread = threading.Thread(target=self._capture, name="pipeline-capture", daemon=True)
+        self.captured = 0
+        self.delivered = 0
+        self.end_to_end = deque(maxlen=BENCHMARK_WINDOW)
+
+    def _capture(self):
+        for frame in self.frames:
+            if self.stop_event.is_set():
+                break
+            self.captured += 1
+            self.queues[0].put(FramePacket(frame))
+        self.queues[0].put(_STOP)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        self.capture_thread.start()
+        return self
+
+    def outputs(self):
+        while True:
+            packet = self.queues[-1].get(timeout=0.5)
+            if packet is _STOP:
+                return
+            if packet is None:
+                if self.stop_event.is_set():
+                    return
+                continue
+            self.end_to_end.append(time.perf_counter() - packet.captured_at)
+            self.delivered += 1
+            yield packet
+
+    def stop(self):
+        # True once the capture thread has exited; until then it may still be inside a blocking
+        # read() on the source, which must not be released under it
+        self.stop_event.set()
+        self.capture_thread.join(timeout=2.0)
+        return not self.capture_thread.is_alive()
+
+    def metrics(self):
+        # Per-stage input queue depth, frames dropped at that queue and mean latency (ms)
+        stats = {}
+        for stage in self.stages:
+            latencies = list(stage.latencies)
+            stats[stage.stage_name] = {
+                'queue_depth': len(stage.in_queue),
+                'dropped': stage.in_queue.dropped,
+                'processed': stage.processed,
+                'latency_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            }
+        e2e = list(self.end_to_end)
+        stats['output'] = {
+            'queue_depth': len(self.queues[-1]),
+            'dropped': self.queues[-1].dropped,
+            'processed': self.delivered,
+            'latency_ms': sum(e2e) / len(e2e) * 1000 if e2e else 0.0,
+        }
+        return stats
+
+    def draw_metrics(self, frame, origin=(10, 120)):
+        x, y = origin
+        for name, stats in self.metrics().items():
+            label = 'end-to-end' if name == 'output' else name
+            cv2.putText(frame, f"{label}: {stats['latency_ms']:.1f}ms q={stats['queue_depth']} drop={stats['dropped']}",
+                        (x, y), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (200, 200, 200), 1)
+            y += 18
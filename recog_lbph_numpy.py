@@ -0,0 +1,7 @@
+from recog_logic import FaceRecognizer
+import sys
+
+if __name__ == '__main__':
+    recognizer = FaceRecognizer('lbph_numpy')
+    print("Starting Recognition. Press 'q' to quit.")
+    recognizer.recognize()
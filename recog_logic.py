@@ -4,12 +4,26 @@ import os
 from pathlib import Path
 from config import *
 from base_engine import FaceEngine, logger
+from subspace_predictor import SubspacePredictor
+from gallery_index import load_gallery
+from tracker import FaceTracker
+from adaptive_detector import AdaptiveDetector
+from frame_source import FrameSource
+from pipeline import FramePipeline
+from training_logic import load_thresholds, load_versioned_label_map, thresholds_path
+from model_store import MODEL_FACTORIES, binary_model_is_current, binary_model_path, load_binary_model, model_path
+from lbph_numpy import LBPHPredictor, NumpyLBPH
+from frame_stride import FrameStride
+from model_host import SharedModelClient
+from model_reloader import ModelReloader
+from instrumentation import instruments
 
 import time
 from collections import deque
 
 class FaceRecognizer(FaceEngine):
-    def __init__(self, model_type):
+    def __init__(self, model_type, tracking=TRACKING_MODE, adaptive=ADAPTIVE_DETECTION, host=USE_MODEL_HOST,
+                 hot_reload=HOT_RELOAD):
         super().__init__()
         self.model_type = model_type
         if model_type == 'eigen':
@@ -24,63 +38,215 @@ class FaceRecognizer(FaceEngine):
             self.model = cv2.face.LBPHFaceRecognizer_create()
             self.model_path = TRAINED_DATA_DIR / 'lbph_trained_data.xml'
             self.threshold = THRESHOLD_LBPH
+        elif model_type == 'lbph_numpy':
+            # Same features and distances as 'lbph', computed in NumPy for a whole frame at once
+            self.model = NumpyLBPH()
+            self.model_path = model_path(model_type)
+            self.threshold = THRESHOLD_LBPH
+        elif model_type == 'dlib':
+            # Deep-learning baseline: HOG/CNN detection and 128-d dlib encodings matched against
+            # the cached gallery (see dlib_gallery.py); face_recognition is imported on load
+            self.model = None
+            self.model_path = DLIB_GALLERY_PATH
+            self.threshold = DLIB_TOLERANCE
         else:
             raise ValueError(f"Unknown model type: {model_type}")
 
+        self.default_threshold = self.threshold
         self.label_map = {}
-        self.load_model()
+        self.label_version = None
+        # Bumped whenever a model is installed, so cached track predictions are redone with the new one
+        self.model_generation = 0
+        self.identity_thresholds = {}
+        self.predictor = None
+        # Client of a running model host (model_host.py) when the model is shared rather than loaded
+        self.host = None
+        self.stale_host = None
+        self.use_host = host and model_type != 'dlib'
+        self.is_loaded = self.load_model()
+        # Retrained models are loaded on a background thread and swapped in between frames; a
+        # host-attached recognizer follows the host instead, until the host dies
+        self.reloader = ModelReloader(self) if hot_reload and model_type != 'dlib' else None
+        # Tracking and adaptive detection drive the Haar cascade; dlib detects on its own and
+        # bounds its cost by skipping frames instead
+        if model_type == 'dlib':
+            tracking = adaptive = False
+        self.tracker = FaceTracker() if tracking else None
+        self.adaptive = AdaptiveDetector(self) if adaptive else None
+        self.stride = FrameStride() if model_type == 'dlib' else None
+        self.last_results = []
         
-        # Metrics tracking
+        # Metrics tracking (the FPS window lives in FaceEngine)
         self.inference_times = deque(maxlen=BENCHMARK_WINDOW)
-        self.fps_deque = deque(maxlen=BENCHMARK_WINDOW)
-        self.last_time = time.time()
 
     def load_model(self):
-        if not self.model_path.exists():
-            logger.warning(f"Model file {self.model_path} not found. Please train first.")
+        if self.model_type == 'dlib':
+            return self.load_dlib_gallery()
+        if self.use_host and self.attach_host():
+            return True
+        state = self.load_state()
+        if state is None:
             return False
+        self.apply_state(state)
+        return True
+
+    def load_state(self):
+        # Loads everything a model switch replaces into fresh objects, leaving the model in use
+        # untouched, so a retrained model can be prepared on a background thread. None on failure.
+        # Eigen/Fisher and the NumPy LBPH engine can skip parsing entirely: the binary store is
+        # memory-mapped and prediction runs through a NumPy predictor
+        use_binary = (MODEL_FORMAT == 'binary' and self.model_type in ('eigen', 'fisher', 'lbph_numpy')
+                      and binary_model_is_current(self.model_type))
+        if not use_binary and not self.model_path.exists():
+            logger.warning(f"Model file {self.model_path} not found. Please train first.")
+            return None
+        # Names come only from the label map written with the model, never from the face_data
+        # listing, which drifts as soon as people are added or removed after training
+        label_map, label_version = load_versioned_label_map(self.model_type)
+        if label_map is None:
+            logger.error(f"No label map for the {self.model_type} model. Please train again.")
+            return None
 
         try:
-            self.model.read(str(self.model_path))
-            person_dirs = sorted([d for d in FACE_DATA_DIR.iterdir() if d.is_dir()])
-            for i, person_dir in enumerate(person_dirs):
-                self.label_map[i] = person_dir.name
-            logger.info(f"Loaded {self.model_type} model and {len(self.label_map)} labels.")
-            return True
+            if use_binary:
+                model = load_binary_model(self.model_type)
+                loaded_path = binary_model_path(self.model_type) / 'meta.json'
+            else:
+                model = NumpyLBPH() if self.model_type == 'lbph_numpy' else MODEL_FACTORIES[self.model_type]()
+                model.read(str(self.model_path))
+                loaded_path = self.model_path
+            predictor = None
+            if self.model_type in ('eigen', 'fisher'):
+                index = self.load_gallery_index(model, loaded_path)
+                # Galleries extended by enrollment are only searchable through the predictor
+                if BATCH_PREDICT or use_binary or len(index) != len(model.getLabels()):
+                    predictor = SubspacePredictor.from_model(model, index)
+            elif self.model_type == 'lbph_numpy':
+                predictor = LBPHPredictor.from_model(model, self.load_gallery_index(model, loaded_path))
+            thresholds = self.load_thresholds(loaded_path) if USE_CALIBRATED_THRESHOLDS else None
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
+            return None
+        logger.info(f"Loaded {self.model_type} model ({'binary' if use_binary else 'xml'}) and "
+                    f"{len(label_map)} labels (label map v{label_version}).")
+        return {'model': model, 'predictor': predictor, 'label_map': label_map, 'label_version': label_version,
+                'loaded_path': loaded_path, 'thresholds': thresholds}
+
+    def apply_state(self, state):
+        # Plain attribute assignments between two frames; nothing is loaded here
+        self.model_generation += 1
+        self.model = state['model']
+        self.predictor = state['predictor']
+        self.label_map = state['label_map']
+        self.label_version = state['label_version']
+        self.loaded_path = state['loaded_path']
+        self.threshold, per_name = state['thresholds'] or (self.default_threshold, {})
+        # Calibrated per person name; resolved to this model's label ids once per model
+        self.identity_thresholds = {label_id: per_name[name] for label_id, name in self.label_map.items() if name in per_name}
+
+    def attach_host(self):
+        # Predicts from the arrays a model host publishes instead of a private copy of the model
+        try:
+            if self.host is None:
+                self.host = SharedModelClient(self.model_type)
+            predictor, label_map = self.host.attach()
+        except FileNotFoundError:
+            if self.host is not None:
+                self.host.close()
+            self.host = None
+            return False
+        loaded_path = model_path(self.model_type)
+        thresholds = self.load_thresholds(loaded_path) if USE_CALIBRATED_THRESHOLDS and loaded_path.exists() else None
+        self.apply_state({'model': self.model, 'predictor': predictor, 'label_map': label_map,
+                          'label_version': self.host.label_version, 'loaded_path': loaded_path, 'thresholds': thresholds})
+        logger.info(f"Attached to shared {self.model_type} model v{self.host.version} with {len(self.label_map)} labels.")
+        return True
+
+    def refresh_model(self):
+        # Called once per frame (or request batch) by the frame loops, whether or not faces are in
+        # view: switches to a model the host republished, or swaps in a retrained model the
+        # reloader has finished loading
+        if self.host is not None:
+            if not self.host.alive():
+                self.detach_host()
+            elif self.host.changed():
+                self.attach_host()
+        elif self.reloader is not None:
+            self.reloader.poll()
+
+    def detach_host(self):
+        # The host died without cleaning up (SIGKILL, crash): its last arrays stay valid but are never
+        # republished, so the model is loaded privately and followed by the reloader from now on
+        host, self.host = self.host, None
+        logger.warning(f"The {self.model_type} model host (pid {host.host_pid()}) stopped; loading the model locally.")
+        if self.load_model():
+            self.is_loaded = True
+        else:
+            logger.error(f"Could not load the {self.model_type} model locally; still using the last shared model.")
+        host.close()
+        # Keeps the mapping alive while the last shared predictor is still in use
+        self.stale_host = host if host.retired else None
+
+    def load_dlib_gallery(self):
+        try:
+            import face_recognition
+            from dlib_gallery import load_or_build_gallery
+        except ImportError as e:
+            logger.error(f"The dlib model needs the face_recognition package: {e}")
             return False
+        self.face_recognition = face_recognition
+        self.gallery = load_or_build_gallery(self.model_path)
+        if len(self.gallery) == 0:
+            logger.warning("The dlib gallery is empty. Please collect faces first.")
+            return False
+        # Gallery rows carry names; label ids follow the sorted names like the other models
+        self.label_map = dict(enumerate(sorted(set(self.gallery.names.tolist()))))
+        label_ids = {name: label_id for label_id, name in self.label_map.items()}
+        self.gallery_labels = np.array([label_ids[name] for name in self.gallery.names])
+        self.loaded_path = self.model_path
+        logger.info(f"Loaded dlib gallery with {len(self.gallery)} encodings and {len(self.label_map)} labels.")
+        return True
+
+    def load_thresholds(self, loaded_path):
+        # Returns (threshold, {label_id: threshold}) from calibrate.py, or None when uncalibrated
+        calibrated = load_thresholds(self.model_type)
+        if calibrated is None:
+            return None
+        if thresholds_path(self.model_type).stat().st_mtime < loaded_path.stat().st_mtime:
+            logger.warning(f"Thresholds for {self.model_type} predate the model; consider running calibrate.py again.")
+        logger.info(f"Using calibrated threshold {calibrated[0]:.2f} ({len(calibrated[1])} per-identity).")
+        return calibrated
+
+    def threshold_for(self, label_id):
+        return self.identity_thresholds.get(label_id, self.threshold)
+
+    def load_gallery_index(self, model, loaded_path):
+        index = load_gallery(self.model_type, model, loaded_path)
+        logger.info(f"Using {index.kind} gallery index over {len(index)} samples.")
+        return index
+
+    def recognize(self, source=0, pipelined=PIPELINE_MODE):
+        if pipelined:
+            return self.recognize_pipelined(source)
 
-    def recognize(self):
-        video_capture = cv2.VideoCapture(0)
+        video_capture = cv2.VideoCapture(source)
         if not video_capture.isOpened():
             logger.error("Could not open video device")
             return
 
         print(f"Starting {self.model_type} Research Evaluation. Press 'q' to exit.")
 
+        frame = None
         while True:
-            ret, frame = video_capture.read()
+            with instruments.span('decode'):
+                # Decode into the previous frame's array; it is not referenced past process_frame
+                ret, frame = video_capture.read(frame)
             if not ret or frame is None:
                 continue
 
-            start_time = time.time()
-            processed_frame = self.process_frame(frame)
-            
-            # Calculate metrics
-            curr_time = time.time()
-            dt = curr_time - self.last_time
-            if dt > 0:
-                self.fps_deque.append(1.0 / dt)
-            self.last_time = curr_time
-
-            # Add overlay info
-            avg_fps = sum(self.fps_deque) / len(self.fps_deque) if self.fps_deque else 0
-            avg_inf = (sum(self.inference_times) / len(self.inference_times)) * 1000 if self.inference_times else 0
-            
-            cv2.putText(processed_frame, f"Algorithm: {self.model_type.upper()}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(processed_frame, f"Inference Time: {avg_inf:.2f}ms", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            cv2.putText(processed_frame, f"FPS: {avg_fps:.1f}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+            with instruments.span('frame'):
+                processed_frame = self.process_frame(frame)
+                self.draw_overlay(processed_frame)
 
             cv2.imshow(f'Research Evaluation - {self.model_type.upper()}', processed_frame)
             
@@ -89,39 +255,219 @@ class FaceRecognizer(FaceEngine):
 
         video_capture.release()
         cv2.destroyAllWindows()
+        instruments.finish_run(self.model_type)
+
+    def recognize_pipelined(self, source=0):
+        # Capture, preprocessing, detection and recognition each run on their own thread; this
+        # thread only draws and shows the newest finished frame
+        try:
+            frames = FrameSource(source)
+        except ValueError as e:
+            logger.error(f"Could not open video device: {e}")
+            return
+
+        def detect(packet):
+            if self.stride is not None:
+                small_rgb = self.dlib_frame(packet.display_frame, reuse=False)
+                packet.faces = (small_rgb, self.dlib_detect(small_rgb))
+            elif self.tracker is not None:
+                # Boxes are snapshotted here because the tracker moves them on the next frame
+                packet.faces = [(track, track.box) for track in self.tracker.update(packet.small_gray, self.detect_faces)]
+            elif self.adaptive is not None:
+                packet.faces = self.adaptive.detect(packet.gray)
+            else:
+                packet.faces = self.detect_faces(packet.small_gray)
 
-    def process_frame(self, frame):
-        display_frame = cv2.flip(frame, 1)
-        gray = cv2.cvtColor(display_frame, cv2.COLOR_BGR2GRAY)
+        def recognize(packet):
+            # The model is only used on this thread, so it is also swapped here
+            self.refresh_model()
+            if self.stride is not None:
+                packet.results = self.dlib_results(*packet.faces)
+            elif self.tracker is not None:
+                packet.results = self.identify_tracks(packet.gray, packet.faces)
+            elif self.adaptive is not None:
+                packet.results = self.recognize_faces(packet.gray, packet.faces, scale=1)
+            else:
+                packet.results = self.recognize_faces(packet.gray, packet.faces)
+
+        pipeline = FramePipeline(frames, [
+            # Packets are in flight on several threads at once, so frames get their own arrays
+            ('preprocess', lambda packet: packet.set_preprocessed(self.preprocess(packet.frame, reuse=False))),
+            ('detect', detect),
+            ('recognize', recognize),
+        ])
+
+        print(f"Starting {self.model_type} Research Evaluation (pipelined). Press 'q' to exit.")
+        pipeline.start()
+        try:
+            for packet in pipeline.outputs():
+                with instruments.span('draw'):
+                    for box, prediction in packet.results:
+                        self.draw_prediction(packet.display_frame, box, prediction)
+                self.draw_overlay(packet.display_frame)
+                pipeline.draw_metrics(packet.display_frame)
+
+                cv2.imshow(f'Research Evaluation - {self.model_type.upper()}', packet.display_frame)
+
+                if cv2.waitKey(1) & 0xFF == ord('q'):
+                    break
+        finally:
+            if pipeline.stop():
+                frames.release()
+            else:
+                logger.warning("Capture thread is still blocked reading the source; leaving it open.")
+            cv2.destroyAllWindows()
+        logger.info(f"Pipeline metrics: {pipeline.metrics()}")
+        instruments.finish_run(f"{self.model_type}_pipelined")
+
+    def draw_overlay(self, frame):
+        avg_fps = self.update_fps()
+        avg_inf = (sum(self.inference_times) / len(self.inference_times)) * 1000 if self.inference_times else 0
         
-        small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR))
-        faces = self.detect_faces(small_gray)
+        cv2.putText(frame, f"Algorithm: {self.model_type.upper()}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+        cv2.putText(frame, f"Inference Time: {avg_inf:.2f}ms", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+        cv2.putText(frame, f"FPS: {avg_fps:.1f}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        if self.stride is not None:
+            cv2.putText(frame, f"Stride: {self.stride.stride}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        if instruments.enabled:
+            p95 = instruments.percentiles('frame').get('p95_ms', 0.0)
+            cv2.putText(frame, f"Frame p95: {p95:.1f}ms", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+
+    def process_frame(self, frame, display=True):
+        # Without display nothing is drawn and None is returned; dlib always needs the colour frame
+        self.refresh_model()
+        display_frame, gray, small_gray = self.preprocess(frame, display=display or self.stride is not None)
+        if self.stride is not None:
+            # Only frames picked by the stride run dlib; the others show the last results
+            if self.stride.should_process():
+                start = time.perf_counter()
+                small_rgb = self.dlib_frame(display_frame)
+                self.last_results = self.dlib_results(small_rgb, self.dlib_detect(small_rgb))
+                self.stride.record(time.perf_counter() - start)
+            results = self.last_results
+        elif self.tracker is not None:
+            results = self.track_faces(gray, small_gray)
+        elif self.adaptive is not None:
+            # Adaptive detection works on the full-resolution frame and returns full-resolution boxes
+            results = self.recognize_faces(gray, self.adaptive.detect(gray), scale=1)
+        else:
+            results = self.recognize_faces(gray, self.detect_faces(small_gray))
+
+        if not display:
+            return None
+        with instruments.span('draw'):
+            for box, prediction in results:
+                self.draw_prediction(display_frame, box, prediction)
+        return display_frame
+
+    def recognize_faces(self, gray, faces, scale=RESIZE_FACTOR):
+        # Returns [(box, (label_id, confidence) or None)] for the detected faces. Crops go into
+        # the scratch pool; they are only needed until predict_faces() returns.
+        crops = [crop for crop in (self.crop_face(gray, face, scale, self.face_buffer(i)) for i, face in enumerate(faces))
+                 if crop is not None]
+        predictions = self.predict_faces([face_resized for _, face_resized in crops])
+        return [(box, prediction) for (box, _), prediction in zip(crops, predictions)]
+
+    def dlib_frame(self, display_frame, reuse=True):
+        # Downscaled RGB copy of the frame, as face_recognition expects
+        buffers = self.buffers.frame(display_frame.shape) if self.buffers is not None and reuse else None
+        with instruments.span('resize'):
+            small = cv2.resize(display_frame, (display_frame.shape[1] // RESIZE_FACTOR, display_frame.shape[0] // RESIZE_FACTOR),
+                               dst=buffers.small_color if buffers else None)
+        with instruments.span('convert'):
+            return cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=buffers.small_rgb if buffers else None)
+
+    def dlib_detect(self, small_rgb):
+        # (top, right, bottom, left) face locations on the downscaled frame
+        with instruments.span('detect'):
+            return self.face_recognition.face_locations(small_rgb, model=DLIB_DETECTION_MODEL)
+
+    def dlib_predict(self, small_rgb, locations):
+        # Encodes every face of the frame in one call and matches them against the gallery at once
+        if not locations:
+            return []
+        inf_start = time.time()
+        with instruments.span('predict'):
+            encodings = self.face_recognition.face_encodings(small_rgb, locations)
+            rows, distances = self.gallery.nearest(encodings)
+        self.inference_times.append((time.time() - inf_start) / len(locations))
+        return [(int(self.gallery_labels[row]), float(dist)) for row, dist in zip(rows, distances)]
+
+    def dlib_results(self, small_rgb, locations):
+        predictions = self.dlib_predict(small_rgb, locations)
+        return [((left * RESIZE_FACTOR, top * RESIZE_FACTOR, (right - left) * RESIZE_FACTOR, (bottom - top) * RESIZE_FACTOR), prediction)
+                for (top, right, bottom, left), prediction in zip(locations, predictions)]
+
+    def track_faces(self, gray, small_gray):
+        tracks = self.tracker.update(small_gray, self.detect_faces)
+        return self.identify_tracks(gray, [(track, track.box) for track in tracks])
+
+    def identify_tracks(self, gray, tracked):
+        # tracked: [(track, box on the downscaled frame)]
+        results, pending = [], []
+        for i, (track, track_box) in enumerate(tracked):
+            crop = self.crop_face(gray, track_box, out=self.face_buffer(i))
+            if crop is None:
+                continue
+            box, face_resized = crop
+            if track.needs_prediction(face_resized, self.model_generation):
+                pending.append((track, face_resized))
+            results.append((box, track))
+
+        # Only new tracks and faces that changed significantly go through predict
+        predictions = self.predict_faces([face_resized for _, face_resized in pending])
+        for (track, face_resized), prediction in zip(pending, predictions):
+            if prediction is not None:
+                track.set_prediction(prediction, face_resized, self.model_generation)
+        return [(box, track.prediction) for box, track in results]
+
+    def draw_prediction(self, display_frame, box, prediction):
+        if prediction is None:
+            return
+        x, y, w, h = box
+        label_id, confidence = prediction
+        is_known = confidence < self.threshold_for(label_id)
         
-        for face in faces:
-            x, y, w, h = [v * RESIZE_FACTOR for v in face]
-            face_roi = gray[y:y+h, x:x+w]
+        if is_known and label_id in self.label_map:
+            name = self.label_map[label_id]
+            color = (0, 255, 0)
+        else:
+            name = "Unknown"
+            color = (0, 0, 255)
             
-            if face_roi.size > 0:
-                face_resized = cv2.resize(face_roi, (FACE_WIDTH, FACE_HEIGHT))
-                
-                inf_start = time.time()
-                try:
-                    label_id, confidence = self.model.predict(face_resized)
-                    self.inference_times.append(time.time() - inf_start)
-                    
-                    is_known = confidence < self.threshold
-                    
-                    if is_known and label_id in self.label_map:
-                        name = self.label_map[label_id]
-                        color = (0, 255, 0)
-                    else:
-                        name = "Unknown"
-                        color = (0, 0, 255)
-                        
-                    cv2.rectangle(display_frame, (x, y), (x + w, y + h), color, 2)
-                    cv2.putText(display_frame, f"{name}: Dist={int(confidence)}", (x, y - 10), 
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
-                except Exception as e:
-                    logger.error(f"Prediction error: {e}")
+        cv2.rectangle(display_frame, (x, y), (x + w, y + h), color, 2)
+        # dlib distances are below 1, the classical models' run into the thousands
+        distance = f"{confidence:.2f}" if self.model_type == 'dlib' else f"{int(confidence)}"
+        cv2.putText(display_frame, f"{name}: Dist={distance}", (x, y - 10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
-        return display_frame
+    def predict_faces(self, face_images):
+        # Returns one (label_id, confidence) per face, or None where prediction failed
+        if not face_images:
+            return []
+        with instruments.span('predict'):
+            return self.predict_batch(face_images)
+
+    def predict_batch(self, face_images):
+        if self.predictor is not None:
+            inf_start = time.time()
+            try:
+                labels, distances = self.predictor.predict(np.stack(face_images))
+            except Exception as e:
+                logger.error(f"Batched prediction error: {e}")
+                return [None] * len(face_images)
+            # Keep the overlay metric per face so it stays comparable with model.predict()
+            self.inference_times.append((time.time() - inf_start) / len(face_images))
+            return [(int(label), float(dist)) for label, dist in zip(labels, distances)]
+
+        predictions = []
+        for face_resized in face_images:
+            inf_start = time.time()
+            try:
+                label_id, confidence = self.model.predict(face_resized)
+                self.inference_times.append(time.time() - inf_start)
+                predictions.append((label_id, confidence))
+            except Exception as e:
+                logger.error(f"Prediction error: {e}")
+                predictions.append(None)
+        return predictions
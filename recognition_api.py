@@ -0,0 +1,258 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+import cv2
+import numpy as np
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from config import *
+from recog_logic import FaceRecognizer
+from instrumentation import instruments
+
+ROUTES = {('POST', '/detect'): 'detect', ('POST', '/recognize'): 'recognize', ('GET', '/health'): 'health'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+async def read_request(reader):
+    # Minimal HTTP/1.1 request parsing: request line, headers and a Content-Length body.
+    # Returns None when the client closed the connection between requests.
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request headers too large")
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length', 0) or 0)
+    if length > API_MAX_BODY:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Bodies are limited to {API_MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b''
+    keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+    return method, target.split('?', 1)[0], body, keep_alive
+
+
+def http_response(status, payload, keep_alive):
+    body = json.dumps(payload).encode()
+    status = HTTPStatus(status)
+    head = (f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('latin-1') + body
+
+
+# Local detection/recognition service. Requests are coalesced into micro-batches: the first
+# pending request waits at most `max_wait` seconds for others to join, up to `max_batch`
+# requests, and requests arriving while a batch runs form the next one. A batch runs on a single
+# worker thread (the recognizer's scratch buffers are not thread-safe); its images are decoded
+# and detected one by one, and the faces of all its recognize requests are predicted together.
+class RecognitionServer:
+    def __init__(self, model_type='lbph', max_batch=API_MAX_BATCH, max_wait=API_MAX_WAIT_MS / 1000):
+        self.recognizer = FaceRecognizer(model_type, tracking=False, adaptive=False)
+        self.model_type = model_type
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(1, thread_name_prefix='recognition')
+        # (kind, image bytes, arrival time, future) of requests waiting for a batch
+        self.pending = deque()
+        self.arrived = None
+        self.requests = 0
+        self.batches = 0
+        self.batch_sizes = deque(maxlen=BENCHMARK_WINDOW)
+        self.max_batch_seen = 0
+        self.start_time = time.time()
+
+    async def submit(self, kind, body):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((kind, body, time.perf_counter(), future))
+        self.arrived.set()
+        return await future
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.arrived.wait()
+            # The oldest request bounds the wait, so requests queued behind a running batch do not wait again
+            deadline = self.pending[0][2] + self.max_wait
+            while len(self.pending) < self.max_batch and time.perf_counter() < deadline:
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), deadline - time.perf_counter())
+                except asyncio.TimeoutError:
+                    break
+            batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+            if not self.pending:
+                self.arrived.clear()
+
+            try:
+                results = await loop.run_in_executor(self.executor, self.analyze_batch, [(kind, body) for kind, body, _, _ in batch])
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} requests failed: {e}")
+                results = [e] * len(batch)
+            for (_, _, _, future), result in zip(batch, results):
+                # Futures of clients that disconnected are already cancelled
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+            self.batches += 1
+            self.batch_sizes.append(len(batch))
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+
+    def analyze_batch(self, items):
+        # Runs on the worker thread. Returns one result dict, or an exception, per (kind, image bytes)
+        recognizer = self.recognizer
+        recognizer.refresh_model()
+        results = [None] * len(items)
+        crops, owners = [], []
+        for i, (kind, body) in enumerate(items):
+            with instruments.span('decode'):
+                image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR) if body else None
+            if image is None:
+                results[i] = HTTPError(HTTPStatus.BAD_REQUEST, "Body is not a decodable image")
+                continue
+            if kind == 'recognize' and not recognizer.is_loaded:
+                results[i] = HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, f"No trained {self.model_type} model is loaded")
+                continue
+            # Posted images are not mirrored, unlike the camera preview
+            with instruments.span('convert'):
+                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+            with instruments.span('resize'):
+                small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR))
+            faces = recognizer.detect_faces(small_gray)
+            if kind == 'detect':
+                results[i] = {'faces': [{'box': [int(v) * RESIZE_FACTOR for v in face]} for face in faces]}
+                continue
+            boxes = []
+            for face in faces:
+                crop = recognizer.crop_face(gray, face, out=recognizer.face_buffer(len(crops)))
+                if crop is not None:
+                    boxes.append(crop[0])
+                    crops.append(crop[1])
+            owners.append((i, boxes))
+
+        # One predict call for the faces of every recognize request in the batch
+        predictions = recognizer.predict_faces(crops)
+        offset = 0
+        for i, boxes in owners:
+            faces = []
+            for box, prediction in zip(boxes, predictions[offset:offset + len(boxes)]):
+                if prediction is None:
+                    continue
+                label_id, confidence = prediction
+                known = confidence < recognizer.threshold_for(label_id) and label_id in recognizer.label_map
+                faces.append({
+                    'box': [int(v) for v in box],
+                    'name': recognizer.label_map[label_id] if known else "Unknown",
+                    'distance': float(confidence),
+                })
+            results[i] = {'faces': faces}
+            offset += len(boxes)
+        return results
+
+    def health(self):
+        sizes = list(self.batch_sizes)
+        recognizer = self.recognizer
+        return {
+            'model': self.model_type,
+            'loaded': recognizer.is_loaded,
+            'label_version': recognizer.label_version,
+            'shared_model_version': recognizer.host.version if recognizer.host is not None else None,
+            'uptime_s': time.time() - self.start_time,
+            'requests': self.requests,
+            'batches': self.batches,
+            'mean_batch_size': float(np.mean(sizes)) if sizes else 0.0,
+            'max_batch_size': self.max_batch_seen,
+            'max_batch': self.max_batch,
+            'max_wait_ms': self.max_wait * 1000,
+        }
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await read_request(reader)
+                    if request is None:
+                        break
+                    method, path, body, keep_alive = request
+                    route = ROUTES.get((method, path))
+                    if route is None:
+                        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+                    if route == 'health':
+                        status, payload = HTTPStatus.OK, self.health()
+                    else:
+                        self.requests += 1
+                        status, payload = HTTPStatus.OK, await self.submit(route, body)
+                except HTTPError as e:
+                    status, payload = e.status, {'error': str(e)}
+                except (ValueError, asyncio.IncompleteReadError) as e:
+                    status, payload, keep_alive = HTTPStatus.BAD_REQUEST, {'error': str(e)}, False
+                except Exception as e:
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)}
+                writer.write(http_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=API_HOST, port=API_PORT, unix_path=None):
+        self.arrived = asyncio.Event()
+        batcher = asyncio.create_task(self.batch_loop())
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle_connection, path=unix_path)
+            where = unix_path
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+            where = f"http://{host}:{port}"
+        logger.info(f"Serving {self.model_type} detection/recognition on {where} "
+                    f"(batches of up to {self.max_batch}, {self.max_wait * 1000:.1f} ms wait)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP API for face detection and recognition with request micro-batching.")
+    parser.add_argument('--model', choices=['lbph', 'lbph_numpy', 'eigen', 'fisher'], default='lbph')
+    parser.add_argument('--host', default=API_HOST)
+    parser.add_argument('--port', type=int, default=API_PORT)
+    parser.add_argument('--unix', dest='unix_path', help="Listen on this Unix socket instead of TCP")
+    parser.add_argument('--max-batch', type=int, default=API_MAX_BATCH, help="Requests coalesced into one batch")
+    parser.add_argument('--max-wait-ms', type=float, default=API_MAX_WAIT_MS,
+                        help="How long the oldest request waits for a batch to fill")
+    args = parser.parse_args(argv)
+
+    server = RecognitionServer(args.model, args.max_batch, args.max_wait_ms / 1000)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix_path))
+    except KeyboardInterrupt:
+        logger.info("Stopping recognition API...")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
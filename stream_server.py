@@ -0,0 +1,201 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import cv2
+from config import *
+from frame_source import FrameSource
+
+# One recognizer (cascade + model) per worker process, shared by every stream that worker serves
+_recognizer = None
+
+
+def _init_worker(model_type):
+    global _recognizer
+    from recog_logic import FaceRecognizer
+    _recognizer = FaceRecognizer(model_type)
+
+
+def _analyze(gray):
+    start = time.perf_counter()
+    _recognizer.refresh_model()
+    small_gray = cv2.resize(gray, (gray.shape[1] // RESIZE_FACTOR, gray.shape[0] // RESIZE_FACTOR))
+    results = _recognizer.recognize_faces(gray, _recognizer.detect_faces(small_gray))
+    faces = []
+    for box, prediction in results:
+        if prediction is None:
+            continue
+        label_id, confidence = prediction
+        known = confidence < _recognizer.threshold_for(label_id) and label_id in _recognizer.label_map
+        faces.append({
+            'box': [int(v) for v in box],
+            'name': _recognizer.label_map[label_id] if known else "Unknown",
+            'distance': float(confidence),
+        })
+    return faces, time.perf_counter() - start
+
+
+class StreamStats:
+    def __init__(self, name):
+        self.name = name
+        self.decoded = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.faces = 0
+        self.latency_total = 0.0
+        self.start = time.perf_counter()
+
+    def summary(self, elapsed):
+        return {
+            'decoded': self.decoded,
+            'processed': self.processed,
+            'dropped': self.dropped,
+            'errors': self.errors,
+            'faces': self.faces,
+            'fps': self.processed / elapsed if elapsed > 0 else 0.0,
+            'mean_latency_ms': self.latency_total / self.processed * 1000 if self.processed else 0.0,
+        }
+
+
+# Decodes every source in its own thread and dispatches detection/recognition to a process pool.
+# Each stream may have at most `max_in_flight` frames queued or in a worker; when that budget is
+# used up the stream either drops the new frame (live sources) or blocks its decoder (backpressure).
+class StreamServer:
+    def __init__(self, model_type, sources, workers=None, max_in_flight=STREAM_MAX_IN_FLIGHT,
+                 drop_frames=True, realtime=True, loop=False):
+        self.model_type = model_type
+        self.sources = list(sources)
+        self.workers = workers or os.cpu_count() or 1
+        self.max_in_flight = max_in_flight
+        self.drop_frames = drop_frames
+        self.realtime = realtime
+        self.loop = loop
+        self.stats = [StreamStats(f"{i}:{source}") for i, source in enumerate(self.sources)]
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.on_result = None
+        self.pool = None
+
+    def _decode(self, stream_id, source):
+        stats = self.stats[stream_id]
+        slots = threading.BoundedSemaphore(self.max_in_flight)
+
+        def done(result):
+            faces, latency = result
+            with self.lock:
+                stats.processed += 1
+                stats.faces += len(faces)
+                stats.latency_total += latency
+            slots.release()
+            if self.on_result is not None:
+                self.on_result(stream_id, faces)
+
+        def failed(error):
+            with self.lock:
+                stats.errors += 1
+            slots.release()
+            logger.error(f"Stream {stats.name}: worker error: {error}")
+
+        try:
+            with FrameSource(source, loop=self.loop, realtime=self.realtime) as frames:
+                for frame in frames:
+                    if self.stop_event.is_set():
+                        break
+                    stats.decoded += 1
+                    if not slots.acquire(blocking=not self.drop_frames):
+                        with self.lock:
+                            stats.dropped += 1
+                        continue
+                    # Gray frames are a third of the size to ship to the worker
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    self.pool.apply_async(_analyze, (gray,), callback=done, error_callback=failed)
+        except ValueError as e:
+            logger.error(f"Stream {stats.name}: {e}")
+
+        # Wait for this stream's outstanding frames
+        for _ in range(self.max_in_flight):
+            slots.acquire()
+
+    def report(self):
+        now = time.perf_counter()
+        with self.lock:
+            streams = {s.name: s.summary(now - s.start) for s in self.stats}
+        elapsed = now - self.start_time
+        processed = sum(s['processed'] for s in streams.values())
+        return {
+            'model': self.model_type,
+            'workers': self.workers,
+            'elapsed_s': elapsed,
+            'aggregate_fps': processed / elapsed if elapsed > 0 else 0.0,
+            'processed': processed,
+            'dropped': sum(s['dropped'] for s in streams.values()),
+            'streams': streams,
+        }
+
+    def run(self, duration=None, report_interval=STREAM_REPORT_INTERVAL):
+        logger.info(f"Starting {self.workers} {self.model_type} workers for {len(self.sources)} streams")
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker, initargs=(self.model_type,))
+        self.start_time = time.perf_counter()
+        for stats in self.stats:
+            stats.start = self.start_time
+
+        threads = [threading.Thread(target=self._decode, args=(i, source), daemon=True)
+                   for i, source in enumerate(self.sources)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            next_report = time.perf_counter() + report_interval
+            while any(thread.is_alive() for thread in threads):
+                if duration is not None and time.perf_counter() - self.start_time >= duration:
+                    break
+                time.sleep(0.1)
+                if time.perf_counter() >= next_report:
+                    report = self.report()
+                    logger.info(f"Aggregate {report['aggregate_fps']:.1f} FPS, "
+                                + ", ".join(f"{name}: {s['fps']:.1f} FPS ({s['dropped']} dropped)"
+                                            for name, s in report['streams'].items()))
+                    next_report += report_interval
+        except KeyboardInterrupt:
+            logger.info("Stopping stream server...")
+        finally:
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+            self.pool.close()
+            self.pool.join()
+
+        return self.report()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-stream recognition server backed by a worker process pool.")
+    parser.add_argument('sources', nargs='+', help="Video files, stream URLs, image directories or camera indexes")
+    parser.add_argument('--model', choices=['lbph', 'lbph_numpy', 'eigen', 'fisher'], default='lbph')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-in-flight', type=int, default=STREAM_MAX_IN_FLIGHT,
+                        help="Frames per stream queued or in a worker before new frames are dropped")
+    parser.add_argument('--no-drop', action='store_true', help="Block decoding instead of dropping frames")
+    parser.add_argument('--fast', action='store_true', help="Decode files as fast as possible instead of at source FPS")
+    parser.add_argument('--loop', action='store_true')
+    parser.add_argument('--duration', type=float, default=None, help="Stop after this many seconds")
+    parser.add_argument('--json', dest='json_path', help="Write the final report as JSON")
+    args = parser.parse_args(argv)
+
+    server = StreamServer(args.model, args.sources, args.workers, args.max_in_flight,
+                          drop_frames=not args.no_drop, realtime=not args.fast, loop=args.loop)
+    report = server.run(args.duration)
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
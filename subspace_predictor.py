@@ -0,0 +1,48 @@
+import numpy as np
+from gallery_index import ExactIndex, stack_rows
+
+
+# Vectorized nearest-neighbour prediction for EigenFaces/FisherFaces.
+# The subspace (eigenvectors, mean) and the training projections are pulled out of the
+# trained OpenCV model once; afterwards any number of faces, from one frame or many,
+# are projected with a single matrix multiply and matched with one batched distance
+# computation instead of one model.predict() round trip per face. The nearest-neighbour
+# step is delegated to a gallery index (exact by default, see gallery_index.py).
+class SubspacePredictor:
+    def __init__(self, eigenvectors, mean, projections, labels, index=None):
+        self.eigenvectors = np.ascontiguousarray(eigenvectors, dtype=np.float64)
+        self.mean = np.asarray(mean, dtype=np.float64).reshape(1, -1)
+        self.index = index if index is not None else ExactIndex(projections, labels)
+
+        # (x - mean) @ W == x @ W - mean @ W, so the mean is only projected once
+        self.mean_projection = self.mean @ self.eigenvectors
+
+    @property
+    def projections(self):
+        return self.index.vectors
+
+    @property
+    def labels(self):
+        return self.index.labels
+
+    @classmethod
+    def from_model(cls, model, index=None):
+        return cls(model.getEigenVectors(), model.getMean(), stack_rows(model.getProjections()), model.getLabels(), index)
+
+    @property
+    def num_features(self):
+        return self.eigenvectors.shape[0]
+
+    def project(self, faces):
+        samples = np.asarray(faces).reshape(len(faces), -1)
+        if samples.shape[1] != self.num_features:
+            raise ValueError(f"Expected faces with {self.num_features} pixels, got {samples.shape[1]}")
+        return samples.astype(np.float64) @ self.eigenvectors - self.mean_projection
+
+    def predict(self, faces):
+        # Returns (labels, distances) arrays with one entry per face, matching model.predict()
+        if len(faces) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        labels, distances, _ = self.index.search(self.project(faces))
+        return labels, distances
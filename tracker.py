@@ -0,0 +1,97 @@
+import cv2
+from config import *
+
+
+def box_iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    inter_w = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    inter_h = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = inter_w * inter_h
+    union = aw * ah + bw * bh - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTrack:
+    def __init__(self, track_id, box, small_gray):
+        self.track_id = track_id
+        self.score = 1.0
+        # Identity cache: prediction and the face it was made on
+        self.prediction = None
+        self.predicted_face = None
+        # Model generation the prediction was made with; label ids of another model mean nothing
+        self.generation = None
+        self.reset(box, small_gray)
+
+    def reset(self, box, small_gray):
+        x, y, w, h = [int(v) for v in box]
+        self.box = (x, y, w, h)
+        self.template = small_gray[y:y+h, x:x+w].copy()
+        self.score = 1.0
+
+    def needs_prediction(self, face_resized, generation=None):
+        if self.prediction is None or generation != self.generation:
+            return True
+        # Re-identify only when the face appearance changed significantly since the last predict
+        return cv2.absdiff(face_resized, self.predicted_face).mean() > TRACK_REIDENTIFY_DIFF
+
+    def set_prediction(self, prediction, face_resized, generation=None):
+        self.prediction = prediction
+        self.generation = generation
+        # Crops may live in a reused scratch buffer; the track keeps its own copy
+        self.predicted_face = face_resized.copy()
+
+
+# Detect-once, track-between: full Haar detection runs every `detect_every` frames, as soon as
+# a track loses confidence, and on every frame while nothing is tracked; in between, boxes are propagated on the downscaled gray frame by
+# template matching inside a window around the previous position.
+class FaceTracker:
+    def __init__(self, detect_every=TRACK_DETECT_EVERY, min_score=TRACK_MIN_SCORE, search_margin=TRACK_SEARCH_MARGIN):
+        self.detect_every = detect_every
+        self.min_score = min_score
+        self.search_margin = search_margin
+        self.tracks = []
+        self.frame_index = 0
+        self.next_id = 0
+        self.detections_run = 0
+
+    def update(self, small_gray, detect):
+        needs_detection = self.frame_index % self.detect_every == 0
+        if not needs_detection:
+            # An empty scene is searched every frame, so a face entering it is found right away
+            needs_detection = not self.tracks or not all(self._follow(track, small_gray) for track in self.tracks)
+        if needs_detection:
+            self._associate(detect(small_gray), small_gray)
+            self.detections_run += 1
+        self.frame_index += 1
+        return self.tracks
+
+    def _follow(self, track, small_gray):
+        x, y, w, h = track.box
+        mx, my = int(w * self.search_margin) + 1, int(h * self.search_margin) + 1
+        x0, y0 = max(0, x - mx), max(0, y - my)
+        x1, y1 = min(small_gray.shape[1], x + w + mx), min(small_gray.shape[0], y + h + my)
+        window = small_gray[y0:y1, x0:x1]
+        if window.shape[0] < h or window.shape[1] < w or track.template.size == 0:
+            track.score = 0.0
+            return False
+
+        scores = cv2.matchTemplate(window, track.template, cv2.TM_CCOEFF_NORMED)
+        _, track.score, _, (dx, dy) = cv2.minMaxLoc(scores)
+        track.box = (x0 + dx, y0 + dy, w, h)
+        return track.score >= self.min_score
+
+    def _associate(self, faces, small_gray):
+        # Greedy IoU matching keeps the identity of tracks that are re-detected
+        unmatched = list(self.tracks)
+        tracks = []
+        for face in faces:
+            best = max(unmatched, key=lambda t: box_iou(t.box, face), default=None)
+            if best is not None and box_iou(best.box, face) >= TRACK_MATCH_IOU:
+                unmatched.remove(best)
+                best.reset(face, small_gray)
+                tracks.append(best)
+            else:
+                tracks.append(FaceTrack(self.next_id, face, small_gray))
+                self.next_id += 1
+        self.tracks = tracks
@@ -0,0 +1,12 @@
+from training_logic import train_all
+import sys
+
+if __name__ == '__main__':
+    results = train_all()
+    for model_type, ok in results.items():
+        print(f"{model_type}: {'trained' if ok else 'FAILED'}")
+    if all(results.values()):
+        print("Training completed successfully")
+    else:
+        print("Training failed. Ensure you have enough data.")
+        sys.exit(1)
@@ -0,0 +1,10 @@
+from training_logic import FaceTrainer
+import sys
+
+if __name__ == '__main__':
+    trainer = FaceTrainer('lbph_numpy')
+    if trainer.train():
+        print("Training completed successfully")
+    else:
+        print("Training failed. Ensure you have enough data.")
+
@@ -1,8 +1,229 @@
 import cv2
+import json
 import numpy as np
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from config import FACE_DATA_DIR, TRAINED_DATA_DIR, logger
+from config import FACE_DATA_DIR, TRAINED_DATA_DIR, FACE_WIDTH, FACE_HEIGHT, LOADER_WORKERS, USE_PACKED_DATASET, GALLERY_INDEX_MIN_SIZE, SAVE_BINARY_MODEL, logger
+from packed_dataset import PackedDataset
+from gallery_index import build_index, gallery_from_model, index_path, load_gallery
+from subspace_predictor import SubspacePredictor
+from model_store import MODEL_FACTORIES, binary_model_path, model_path, save_binary_model, xml_model_path
+from lbph_numpy import NumpyLBPH
+from instrumentation import instruments
+
+def decode_images(paths, workers=LOADER_WORKERS):
+    # Decodes face images in a thread pool (cv2.imread releases the GIL) straight into one
+    # preallocated, contiguous N x FACE_HEIGHT x FACE_WIDTH uint8 array.
+    # Returns (images, valid mask, seconds).
+    images = np.empty((len(paths), FACE_HEIGHT, FACE_WIDTH), dtype=np.uint8)
+
+    def decode(i):
+        with instruments.span('decode'):
+            img = cv2.imread(str(paths[i]), cv2.IMREAD_GRAYSCALE)
+        if img is None:
+            return False
+        if img.shape != images.shape[1:]:
+            with instruments.span('resize'):
+                img = cv2.resize(img, (FACE_WIDTH, FACE_HEIGHT))
+        images[i] = img
+        return True
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        valid = np.fromiter(executor.map(decode, range(len(paths))), dtype=bool, count=len(paths))
+    return images, valid, time.perf_counter() - start
+
+
+def load_dataset(face_data_dir=FACE_DATA_DIR, workers=LOADER_WORKERS):
+    person_dirs = sorted(d for d in face_data_dir.iterdir() if d.is_dir())
+    if not person_dirs:
+        logger.error("No training data found in face_data directory.")
+        return None, None, None
+
+    label_map, paths, labels = {}, [], []
+    for label_id, person_dir in enumerate(person_dirs):
+        label_map[label_id] = person_dir.name
+        person_paths = sorted(person_dir.glob("*.png"))
+        paths.extend(person_paths)
+        labels.extend([label_id] * len(person_paths))
+
+    labels = np.array(labels, dtype=np.int32)
+    images, valid, elapsed = decode_images(paths, workers)
+
+    if not valid.all():
+        logger.warning(f"Skipped {int((~valid).sum())} unreadable images.")
+        images, labels = images[valid], labels[valid]
+    if len(images) == 0:
+        logger.error("No valid images found.")
+        return None, None, None
+
+    counts = np.bincount(labels, minlength=len(label_map))
+    for label_id, name in label_map.items():
+        logger.info(f"Loaded {counts[label_id]} images for {name}")
+    rate = len(images) / elapsed if elapsed > 0 else float('inf')
+    logger.info(f"Decoded {len(images)} images ({images.nbytes / 1e6:.1f} MB) in {elapsed:.2f}s ({rate:.0f} images/s)")
+    return images, labels, label_map
+
+
+def load_training_data():
+    # The packed dataset is memory-mapped without decoding; otherwise the PNG directories are decoded
+    packed = PackedDataset()
+    if USE_PACKED_DATASET and len(packed) > 0:
+        return packed.load()
+    return load_dataset()
+
+
+def load_person_images(person_name):
+    # Only the given person's faces, from the packed dataset or their PNG directory
+    packed = PackedDataset()
+    if USE_PACKED_DATASET and person_name in packed.names():
+        images, labels, _ = packed.load()
+        return np.asarray(images[labels == packed.names().index(person_name)])
+    paths = sorted((FACE_DATA_DIR / person_name).glob("*.png"))
+    images, valid, _ = decode_images(paths)
+    return images[valid]
+
+
+def label_map_path(model_type):
+    return TRAINED_DATA_DIR / f'{model_type}_labels.json'
+
+
+def save_label_map(model_type, label_map):
+    # Every save gets the next version; the file is swapped in whole so a reloading recognizer never reads it half-written
+    path = label_map_path(model_type)
+    version = load_versioned_label_map(model_type)[1] + 1
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': version, 'labels': {str(k): v for k, v in label_map.items()}}, f, indent=2)
+    os.replace(tmp_path, path)
+    return version
+
+
+def load_versioned_label_map(model_type):
+    # Returns (label_map, version), or (None, 0) without a label map; unversioned label maps count as version 0
+    path = label_map_path(model_type)
+    if not path.exists():
+        return None, 0
+    with open(path) as f:
+        data = json.load(f)
+    labels, version = (data['labels'], data['version']) if 'labels' in data else (data, 0)
+    return {int(k): v for k, v in labels.items()}, version
+
+
+def load_label_map(model_type):
+    return load_versioned_label_map(model_type)[0]
+
+
+def model_signature(model_type):
+    # Modification times of the files a trained model consists of; changes whenever it is retrained or enrolled into
+    paths = [xml_model_path(model_type), binary_model_path(model_type) / 'meta.json', label_map_path(model_type), index_path(model_type)]
+    return tuple(path.stat().st_mtime_ns if path.exists() else None for path in paths)
+
+
+# Reports a retrained model once its files have stopped changing for one poll: training writes
+# the model, binary store, label map and gallery index one after another
+class ModelWatcher:
+    def __init__(self, model_type):
+        self.model_type = model_type
+        self.signature = model_signature(model_type)
+        self.pending = None
+
+    def poll(self):
+        # Returns the new signature once a change has settled, else None
+        signature = model_signature(self.model_type)
+        if signature == self.signature:
+            self.pending = None
+        elif signature == self.pending:
+            self.signature, self.pending = signature, None
+            return signature
+        else:
+            self.pending = signature
+        return None
+
+
+def thresholds_path(model_type):
+    return TRAINED_DATA_DIR / f'{model_type}_thresholds.json'
+
+
+def save_thresholds(model_type, calibration):
+    with open(thresholds_path(model_type), 'w') as f:
+        json.dump(calibration, f, indent=2)
+
+
+def load_thresholds(model_type):
+    # Returns (threshold, {person name: threshold}) written by calibrate.py, or None when uncalibrated
+    path = thresholds_path(model_type)
+    if not path.exists():
+        return None
+    with open(path) as f:
+        calibration = json.load(f)
+    per_identity = calibration.get('per_identity', {})
+    if per_identity and calibration.get('per_identity_keys') != 'name':
+        # Older files keyed these by training label id, which need not match the model's label map
+        logger.warning(f"Ignoring per-identity thresholds in {path}; run calibrate.py --per-identity again.")
+        per_identity = {}
+    return calibration['threshold'], per_identity
+
+
+def train_models(model_types):
+    # Trains several model types sequentially from one decoded dataset (see train_all for the parallel version)
+    dataset = load_training_data()
+    if dataset[0] is None:
+        return {model_type: False for model_type in model_types}
+    return {model_type: FaceTrainer(model_type).train(dataset) for model_type in model_types}
+
+
+# Dataset handed to train_all() workers; with the fork start method it is inherited, not copied
+_shared_dataset = None
+
+
+def _init_train_worker(dataset):
+    global _shared_dataset
+    _shared_dataset = dataset
+
+
+def _train_worker(model_type):
+    start = time.perf_counter()
+    ok = FaceTrainer(model_type).train(_shared_dataset)
+    return ok, time.perf_counter() - start
+
+
+def train_all(model_types=('lbph', 'eigen', 'fisher'), workers=None):
+    # Loads and preprocesses face_data once, then trains every model type concurrently in a
+    # process pool. All models are trained from the same label map.
+    start = time.perf_counter()
+    dataset = load_training_data()
+    if dataset[0] is None:
+        return {model_type: False for model_type in model_types}
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or len(model_types),
+                             initializer=_init_train_worker, initargs=(dataset,)) as executor:
+        futures = {model_type: executor.submit(_train_worker, model_type) for model_type in model_types}
+        for model_type, future in futures.items():
+            try:
+                results[model_type], elapsed = future.result()
+                logger.info(f"{model_type} training finished in {elapsed:.2f}s")
+            except Exception as e:
+                logger.error(f"{model_type} training worker failed: {e}")
+                results[model_type] = False
+
+    logger.info(f"Trained {sum(results.values())}/{len(model_types)} models in {time.perf_counter() - start:.2f}s")
+    return results
+
+
+def enroll_all(person_name, images=None):
+    # Enrolls one person into every model type that has already been trained. `images` are faces
+    # not yet in any model; without them a new person's whole directory is enrolled.
+    results = {}
+    for model_type in ('lbph', 'lbph_numpy', 'eigen', 'fisher'):
+        trainer = FaceTrainer(model_type)
+        if trainer.save_path.exists():
+            results[model_type] = trainer.enroll(person_name, images)
+    return results
+
 
 class FaceTrainer:
     def __init__(self, model_type):
@@ -16,42 +237,20 @@ class FaceTrainer:
         elif model_type == 'lbph':
             self.model = cv2.face.LBPHFaceRecognizer_create()
             self.save_path = TRAINED_DATA_DIR / 'lbph_trained_data.xml'
+        elif model_type == 'lbph_numpy':
+            self.model = NumpyLBPH()
+            self.save_path = model_path(model_type)
         else:
             raise ValueError(f"Unknown model type: {model_type}")
 
     def load_dataset(self):
-        images, labels = [], []
-        label_map = {}
-        current_id = 0
-        
-        person_dirs = [d for d in FACE_DATA_DIR.iterdir() if d.is_dir()]
-        
-        if not person_dirs:
-            logger.error("No training data found in face_data directory.")
-            return None, None, None
-
         logger.info(f"Loading dataset for {self.model_type} training...")
-        
-        for person_dir in person_dirs:
-            label_map[current_id] = person_dir.name
-            count = 0
-            for img_path in person_dir.glob("*.png"):
-                img = cv2.imread(str(img_path), cv2.IMREAD_GRAYSCALE)
-                if img is not None:
-                    images.append(img)
-                    labels.append(current_id)
-                    count += 1
-            logger.info(f"Loaded {count} images for {person_dir.name}")
-            current_id += 1
-            
-        if not images:
-            logger.error("No valid images found.")
-            return None, None, None
-            
-        return images, np.array(labels), label_map
-
-    def train(self):
-        images, labels, label_map = self.load_dataset()
+        return load_training_data()
+
+    def train(self, dataset=None):
+        # `dataset` is an (images, labels, label_map) tuple from load_dataset(), so several
+        # models can be trained from a single decoded copy of face_data
+        images, labels, label_map = dataset if dataset is not None else self.load_dataset()
         
         if images is None or len(images) == 0:
             return False
@@ -62,10 +261,88 @@ class FaceTrainer:
 
         try:
             logger.info(f"Starting {self.model_type} training...")
-            self.model.train(images, labels)
-            self.model.save(str(self.save_path))
+            with instruments.span('train'):
+                self.model.train(list(images), labels)
+            with instruments.span('save'):
+                self.model.save(str(self.save_path))
+                if SAVE_BINARY_MODEL and self.model_type in MODEL_FACTORIES:
+                    save_binary_model(self.model_type, self.model)
+                save_label_map(self.model_type, label_map)
             logger.info(f"Model saved to {self.save_path}")
+            with instruments.span('index'):
+                self.save_gallery_index()
+            instruments.finish_run(f"train_{self.model_type}")
             return True
         except Exception as e:
             logger.error(f"Training failed: {e}")
             return False
+
+    def save_gallery_index(self):
+        # Training only persists approximate indexes; exact search is rebuilt from the model at load time
+        vectors, labels, metric = gallery_from_model(self.model_type, self.model)
+        index = build_index(vectors, labels, metric)
+        path = index_path(self.model_type)
+        if index.kind == 'exact':
+            path.unlink(missing_ok=True)
+            return
+        index.save(path)
+        logger.info(f"Saved {index.kind} gallery index over {len(index)} samples to {path}")
+
+    def enroll(self, person_name, images=None):
+        # Adds one person's faces to the saved model without retraining on the whole gallery.
+        # LBPH appends histograms via update(); EigenFaces/FisherFaces keep their trained subspace
+        # and append the new projections to the persisted gallery index (a gallery-append, the
+        # subspace itself is only refreshed by the next full train()).
+        # `images` must be faces that are not in the model yet. Without them only a new person can
+        # be enrolled: a known person's directory also holds the faces already trained in, which
+        # would be appended to the gallery a second time.
+        label_map = load_label_map(self.model_type)
+        if not self.save_path.exists() or label_map is None:
+            logger.warning(f"No trained {self.model_type} model to enroll into; running full training.")
+            return self.train()
+
+        if images is None:
+            if person_name in label_map.values():
+                logger.info(f"{person_name} is already in the {self.model_type} model and no new faces were given; "
+                            f"running full training.")
+                return self.train()
+            images = load_person_images(person_name)
+        if len(images) == 0:
+            logger.error(f"No images found for {person_name}.")
+            return False
+
+        start = time.perf_counter()
+        ids = {name: label_id for label_id, name in label_map.items()}
+        label_id = ids.get(person_name, max(label_map, default=-1) + 1)
+        label_map[label_id] = person_name
+        labels = np.full(len(images), label_id, dtype=np.int32)
+
+        try:
+            self.model.read(str(self.save_path))
+            if self.model_type in ('lbph', 'lbph_numpy'):
+                # Look up the persisted index before the model file is rewritten and becomes newer
+                index = load_gallery(self.model_type, self.model, self.save_path, rebuild=False)
+                self.model.update(list(images), labels)
+                self.model.save(str(self.save_path))
+                if SAVE_BINARY_MODEL and self.model_type in MODEL_FACTORIES:
+                    save_binary_model(self.model_type, self.model)
+                histograms = self.model.getHistograms()[-len(images):]
+                if index is not None:
+                    index.add(np.vstack([h.reshape(1, -1) for h in histograms]), labels)
+                    index.save(index_path(self.model_type))
+                elif len(self.model.getLabels()) >= GALLERY_INDEX_MIN_SIZE:
+                    self.save_gallery_index()
+            else:
+                # The gallery index becomes the gallery of record for eigen/fisher
+                index = load_gallery(self.model_type, self.model, self.save_path)
+                predictor = SubspacePredictor.from_model(self.model, index)
+                index.add(predictor.project(images), labels)
+                index.save(index_path(self.model_type))
+            save_label_map(self.model_type, label_map)
+        except Exception as e:
+            logger.error(f"Enrollment failed: {e}")
+            return False
+
+        logger.info(f"Enrolled {person_name} ({len(images)} images) into {self.model_type} "
+                    f"in {time.perf_counter() - start:.2f}s")
+        return True